@@ -0,0 +1,807 @@
+# bench.py - Офлайн-бенчмарки парсера, збереження графіків і розсилки
+#
+# Запуск: python bench.py [--output bench_results.json] [--compare old.json]
+#         [--fixtures DIR] [--save-fixtures DIR] [--quick]
+#         python bench.py --check [--fixtures DIR]
+#         python bench.py --record [DIR]
+#
+# --check - перевірка правильності: parse_schedule на збережених сторінках
+# (fixtures/*.html) порівнюється з очікуваним результатом (*.json поруч),
+# отриманим попереднім парсером на BeautifulSoup (reference_parse);
+# також кожен графік зі сторінок має перетворюватись на маску (slots.py).
+#
+# --record - єдиний режим, якому потрібна мережа: зберігає справжні сторінки
+# "сьогодні/завтра" кожного міста з sources.py у fixtures/ разом з очікуваним
+# результатом. Збережені сторінки fixtures/*_today.html входять і в --check,
+# і у звичайний запуск поряд зі згенерованими.
+#
+# Мережа не потрібна: сторінки генеруються в розмітці bezsvitla.com.ua
+# і додаються збережені з fixtures/ (або беруться лише з --fixtures),
+# сайт підміняється httpx.MockTransport, Telegram - заглушкою бота,
+# БД - тимчасовим файлом.
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+import broadcast
+import cache
+import database
+import parser
+import reminders
+import timeline
+from config import TIMEZONE
+from slots import mask_to_blob, mask_to_ranges, ranges_to_mask
+from sources import SOURCES, Source
+
+# Розміри згенерованих сторінок: назва -> (черг, відключень на чергу, зайвих блоків на сторінці)
+FIXTURE_SIZES = {
+    "small": (9, 3, 20),
+    "medium": (24, 8, 80),
+    "large": (60, 24, 300)
+}
+
+# Збережені сторінки і очікувані результати розбору
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# БД з репозиторію зі справжніми графіками (перевіряється її копія)
+REAL_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.db")
+
+HISTORY_SIZES = [0, 10_000, 100_000]
+QUICK_HISTORY_SIZES = [0, 10_000]
+
+def make_queues(count):
+    """Назви підчерг як на сайті: 1.1, 1.2, 2.1, ..."""
+    return [f"{group}.{sub}" for group in range(1, count // 2 + 2) for sub in (1, 2)][:count]
+
+def make_schedule(queues, intervals, rng):
+    """Випадковий графік {черга: [проміжки]} з кроком 15 хв"""
+    schedules = {}
+    
+    for queue in queues:
+        slots = sorted(rng.sample(range(0, 96, 2), intervals * 2))
+        schedules[queue] = [
+            f"{start * 15 // 60:02d}:{start * 15 % 60:02d}-{end * 15 // 60:02d}:{end * 15 % 60:02d}"
+            for start, end in zip(slots[::2], slots[1::2])
+        ]
+    
+    return schedules
+
+def render_page(schedules, filler_blocks, rng):
+    """HTML-сторінка в розмітці bezsvitla.com.ua"""
+    parts = [
+        "<!DOCTYPE html><html lang='uk'><head><meta charset='utf-8'>",
+        "<title>Графік відключень світла Жмеринка</title></head><body>",
+        "<header><nav><ul><li><a href='/'>Головна</a></li><li><a href='/vinnytska-oblast'>Вінницька область</a></li></ul></nav></header>",
+        "<main><h1>Графік відключень світла у Жмеринці</h1>"
+    ]
+    
+    for index in range(filler_blocks):
+        parts.append(
+            f"<div class='news'><p>Новина {index}: <strong>увага</strong> {'текст ' * rng.randint(5, 30)}</p></div>"
+        )
+        
+        if index == filler_blocks // 2:
+            parts.append("<section class='schedule'>")
+            
+            for queue, time_ranges in schedules.items():
+                parts.append(f"<div class='queue'><strong>Черга {queue}</strong><ul>")
+                
+                previous_end = "00:00"
+                for time_range in time_ranges:
+                    start, end = time_range.split("-")
+                    if start != previous_end:
+                        parts.append(f"<li>💡 {previous_end} – {start}</li>")
+                    parts.append(f"<li>🔴 {start} – {end}</li>")
+                    previous_end = end
+                
+                if previous_end != "24:00":
+                    parts.append(f"<li>💡 {previous_end} – 24:00</li>")
+                
+                parts.append("</ul></div>")
+            
+            parts.append("</section>")
+    
+    parts.append("</main><footer><ul><li>© bezsvitla.com.ua</li></ul></footer></body></html>")
+    return "".join(parts).encode("utf-8")
+
+def generate_fixtures():
+    """{назва: (сторінка на сьогодні, сторінка на завтра)} для всіх розмірів"""
+    rng = random.Random(2024)
+    fixtures = {}
+    
+    for name, (queue_count, intervals, filler_blocks) in FIXTURE_SIZES.items():
+        queues = make_queues(queue_count)
+        fixtures[name] = tuple(
+            render_page(make_schedule(queues, intervals, rng), filler_blocks, rng)
+            for _ in ("today", "tomorrow")
+        )
+    
+    return fixtures
+
+def load_fixtures(directory):
+    """Збережені сторінки: <назва>_today.html і <назва>_tomorrow.html"""
+    fixtures = {}
+    
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith("_today.html"):
+            continue
+        
+        name = file_name[:-len("_today.html")]
+        with open(os.path.join(directory, file_name), "rb") as f:
+            today = f.read()
+        
+        tomorrow_path = os.path.join(directory, f"{name}_tomorrow.html")
+        if os.path.exists(tomorrow_path):
+            with open(tomorrow_path, "rb") as f:
+                tomorrow = f.read()
+        else:
+            tomorrow = today
+        
+        fixtures[name] = (today, tomorrow)
+    
+    return fixtures
+
+def save_fixtures(fixtures, directory):
+    """Записує сторінки у файли (для перегляду або як основу для --fixtures)"""
+    os.makedirs(directory, exist_ok=True)
+    
+    for name, (today, tomorrow) in fixtures.items():
+        for day, page in (("today", today), ("tomorrow", tomorrow)):
+            with open(os.path.join(directory, f"{name}_{day}.html"), "wb") as f:
+                f.write(page)
+
+def reference_parse(html):
+    """Попередній парсер (BeautifulSoup, html.parser) - еталон для --check
+    
+    bs4 потрібен лише для запису нових очікуваних результатів і перевірки
+    згенерованих сторінок; ботові він не потрібен.
+    """
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(html.decode("utf-8"), "html.parser")
+    queues = {}
+    
+    for block in soup.find_all("strong"):
+        match = re.search(r"Черга\s+([\d\.]+)", block.get_text())
+        if not match:
+            continue
+        
+        time_slots = []
+        next_ul = block.find_next("ul")
+        
+        if next_ul:
+            for item in next_ul.find_all("li"):
+                item_text = item.get_text(strip=True)
+                
+                if "💡" in item_text:
+                    continue
+                
+                time_match = re.search(r"(\d{2}:\d{2})\s*[–-]\s*(\d{2}:\d{2})", item_text)
+                if time_match:
+                    time_slots.append(f"{time_match.group(1)}-{time_match.group(2)}")
+        
+        queues[match.group(1)] = time_slots
+    
+    return queues
+
+def write_expected(directory):
+    """Записує reference_parse для кожної сторінки теки в <сторінка>.json"""
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".html"):
+            continue
+        
+        path = os.path.join(directory, file_name)
+        with open(path, "rb") as f:
+            expected = reference_parse(f.read())
+        
+        with open(path[:-len(".html")] + ".json", "w", encoding="utf-8") as f:
+            json.dump(expected, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+def record_pages(directory):
+    """Зберігає справжні сторінки "сьогодні/завтра" всіх міст і очікуваний результат"""
+    os.makedirs(directory, exist_ok=True)
+    date = datetime.now(TIMEZONE).strftime("%Y-%m-%d")
+    saved = []
+    
+    with httpx.Client(headers=parser.HEADERS, timeout=httpx.Timeout(15.0, connect=5.0), follow_redirects=True) as client:
+        for source in SOURCES.values():
+            name = f"{source.host.split('.')[0]}_{date}"
+            
+            for day, url in (("today", source.url), ("tomorrow", source.tomorrow_url)):
+                response = client.get(url)
+                response.raise_for_status()
+                
+                path = os.path.join(directory, f"{name}_{day}.html")
+                with open(path, "wb") as f:
+                    f.write(response.content)
+                saved.append(path)
+    
+    # Очікуваний результат - від еталонного парсера, а не від того, що перевіряється
+    for path in saved:
+        with open(path, "rb") as f:
+            expected = reference_parse(f.read())
+        
+        with open(path[:-len(".html")] + ".json", "w", encoding="utf-8") as f:
+            json.dump(expected, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        
+        print(f"  💾 {os.path.basename(path)}: {len(expected)} черг")
+    
+    return saved
+
+# (проміжки, очікувані mask_to_ranges); None - маска неможлива
+SLOT_CASES = [
+    (["08:00-10:00", "09:00-12:00"], ["08:00-12:00"]),
+    (["22:00-00:00"], ["22:00-24:00"]),
+    (["20:00-23:59"], ["20:00-24:00"]),
+    (["00:00-23:59"], ["00:00-24:00"]),
+    (["04:00-06:00", "08:00-12:00", "14:00-18:00", "20:00-23:59"], ["04:00-06:00", "08:00-12:00", "14:00-18:00", "20:00-24:00"]),
+    (["09:00-10:10"], None),
+    (["10:00-09:00"], None),
+    (["24:00-23:59"], None),
+]
+
+def check_slots(directory):
+    """ranges_to_mask на контрольних випадках і на всіх збережених сторінках"""
+    ok = True
+    
+    for time_ranges, expected in SLOT_CASES:
+        mask = ranges_to_mask(time_ranges)
+        actual = None if mask is None else mask_to_ranges(mask)
+        if actual != expected:
+            ok = False
+            print(f"  ❌ {time_ranges}: очікувалось {expected}, отримано {actual}")
+    
+    # Графік зі справжньої сторінки має перетворюватись на маску, інакше
+    # не працюють /now, нагадування і повідомлення про зміни
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".html"):
+            continue
+        
+        with open(os.path.join(directory, file_name), "rb") as f:
+            schedules = parser.parse_schedule(f.read())
+        
+        for queue, time_ranges in schedules.items():
+            if ranges_to_mask(time_ranges) is None:
+                ok = False
+                print(f"  ❌ {file_name}, черга {queue}: немає маски для {time_ranges}")
+    
+    if ok:
+        print(f"  ✅ Маски: {len(SLOT_CASES)} випадків і всі графіки зі сторінок")
+    
+    return ok
+
+def check_power_now(db_path):
+    """/now на графіках з копії справжньої БД: під час кожного відключення світла немає"""
+    import bot
+    
+    ok = True
+    checked = 0
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        use_database(shutil.copy(db_path, workdir))
+        cache.add_schedule_listener(timeline.update_schedules)
+        
+        rows = database.get_connection().execute(
+            "SELECT city, date, queue, time_ranges, slots FROM outages ORDER BY city, date, queue"
+        ).fetchall()
+        
+        for city, date, queue, time_ranges, slots in rows:
+            for time_range in database._decode_schedule(time_ranges, slots) or []:
+                moment = datetime.fromisoformat(f"{date} {time_range[:5]}").replace(tzinfo=TIMEZONE)
+                text = bot.power_status_text(city, queue, moment + timedelta(minutes=1))
+                checked += 1
+                
+                if "Зараз світла немає" not in text:
+                    ok = False
+                    print(f"  ❌ {city}, {date}, черга {queue}, {time_range}: {text.splitlines()[-1]}")
+        
+        close_database()
+    
+    if ok:
+        print(f"  ✅ /now: {checked} відключень у {len(rows)} графіках з {os.path.basename(db_path)}")
+    
+    return ok
+
+def check_reminders():
+    """Нагадування для графіка, що закінчується о 23:59: мають бути всі переходи"""
+    city, queue = key = ("Перевірка", "1.1")
+    tomorrow = datetime.now(TIMEZONE).date() + timedelta(days=1)
+    day_after = tomorrow + timedelta(days=1)
+    
+    timeline.update_schedules([
+        (city, tomorrow.isoformat(), queue, ["04:00-06:00", "20:00-23:59"]),
+        (city, day_after.isoformat(), queue, ["00:00-02:00"]),
+    ])
+    reminders.reschedule_queues({key})
+    
+    generation = reminders._generations[key]
+    actual = sorted(
+        (timeline.from_minute(minute), outage_starts)
+        for _, _, event_key, minute, outage_starts, event_generation in reminders._events
+        if event_key == key and event_generation == generation
+    )
+    # Відключення 20:00-23:59 і 00:00-02:00 - одне, через північ
+    expected = [
+        (datetime.combine(tomorrow, datetime.min.time()) + timedelta(hours=4), True),
+        (datetime.combine(tomorrow, datetime.min.time()) + timedelta(hours=6), False),
+        (datetime.combine(tomorrow, datetime.min.time()) + timedelta(hours=20), True),
+        (datetime.combine(day_after, datetime.min.time()) + timedelta(hours=2), False),
+    ]
+    
+    if actual != expected:
+        print(f"  ❌ Нагадування: очікувались {[(at.strftime('%d %H:%M'), starts) for at, starts in expected]}, "
+              f"заплановано {[(at.strftime('%d %H:%M'), starts) for at, starts in actual]}")
+        return False
+    
+    print(f"  ✅ Нагадування: {len(actual)} переходи для графіка до 23:59")
+    return True
+
+def check_parser(directory):
+    """parse_schedule проти очікуваних результатів; True, якщо все збіглося"""
+    ok = True
+    checked = 0
+    
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".html"):
+            continue
+        
+        path = os.path.join(directory, file_name)
+        expected_path = path[:-len(".html")] + ".json"
+        
+        if not os.path.exists(expected_path):
+            print(f"  ⚠️ {file_name}: немає {os.path.basename(expected_path)}, пропускаю")
+            continue
+        
+        with open(path, "rb") as f:
+            html = f.read()
+        with open(expected_path, encoding="utf-8") as f:
+            expected = json.load(f)
+        
+        checked += 1
+        actual = parser.parse_schedule(html)
+        # Порядок черг теж має збігатися: від нього залежать кнопки і повідомлення
+        if list(actual.items()) == list(expected.items()):
+            print(f"  ✅ {file_name}: {len(actual)} черг")
+            continue
+        
+        ok = False
+        print(f"  ❌ {file_name}")
+        for queue in dict.fromkeys([*expected, *actual]):
+            if expected.get(queue) != actual.get(queue):
+                print(f"      черга {queue}: очікувалось {expected.get(queue)}, отримано {actual.get(queue)}")
+        if list(actual) != list(expected) and set(actual) == set(expected):
+            print(f"      порядок черг: очікувався {list(expected)}, отримано {list(actual)}")
+    
+    # Згенеровані сторінки перевіряються прямо проти еталона, якщо є bs4
+    try:
+        import bs4  # noqa: F401
+    except ImportError:
+        print("  ⚠️ bs4 не встановлено: згенеровані сторінки не перевіряються")
+    else:
+        for name, pages in generate_fixtures().items():
+            for day, page in zip(("today", "tomorrow"), pages):
+                checked += 1
+                if parser.parse_schedule(page) == reference_parse(page):
+                    print(f"  ✅ згенерована {name}_{day}")
+                else:
+                    ok = False
+                    print(f"  ❌ згенерована {name}_{day}: результат відрізняється від reference_parse")
+    
+    if not checked:
+        print("  ⚠️ Немає сторінок для перевірки")
+    
+    return ok
+
+def measure(func, min_time=0.5, max_ops=1_000_000):
+    """Повторює func, доки не мине min_time; повертає статистику на одну операцію"""
+    samples = []
+    started = time.perf_counter()
+    
+    while len(samples) < max_ops:
+        begin = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - begin)
+        
+        if time.perf_counter() - started >= min_time and len(samples) >= 5:
+            break
+    
+    return summarize(samples)
+
+async def measure_async(func, min_time=0.5, max_ops=100_000):
+    """measure для корутин"""
+    samples = []
+    started = time.perf_counter()
+    
+    while len(samples) < max_ops:
+        begin = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - begin)
+        
+        if time.perf_counter() - started >= min_time and len(samples) >= 5:
+            break
+    
+    return summarize(samples)
+
+def summarize(samples):
+    total = sum(samples)
+    return {
+        "ops": len(samples),
+        "mean_ms": total / len(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "ops_per_second": len(samples) / total if total else None
+    }
+
+@contextlib.contextmanager
+def quiet():
+    """Приховує print модулів бота під час вимірювань"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def close_database():
+    """Закриває з'єднання database.py поточного потоку"""
+    conn = getattr(database._local, "conn", None)
+    if conn is not None:
+        conn.close()
+    database._local.conn = None
+
+def use_database(path):
+    """Перемикає database.py на іншу БД і очищає кеш"""
+    close_database()
+    database.DB_PATH = path
+    cache._replace_schedules({})
+    
+    with quiet():
+        database.init_db()
+
+def seed_history(history_size, queues):
+    """Заповнює БД минулими графіками та history_size записами історії"""
+    conn = database.get_connection()
+    rng = random.Random(history_size)
+    base = datetime(2020, 1, 1)
+    days = max(1, history_size // 50)
+    
+    outages = []
+    for day in range(days):
+        date = (base + timedelta(days=day)).strftime("%Y-%m-%d")
+        for queue in queues:
+            outages.append((date, queue, mask_to_blob(rng.getrandbits(96)), "2020-01-01 00:00:00"))
+    
+    history = []
+    for index in range(history_size):
+        day = index % days
+        changed_at = (base + timedelta(days=day, seconds=index)).strftime("%Y-%m-%d %H:%M:%S")
+        history.append((
+            (base + timedelta(days=day)).strftime("%Y-%m-%d"),
+            rng.choice(queues),
+            '["08:00-10:00"]',
+            "[]",
+            changed_at
+        ))
+    
+    with conn:
+        conn.executemany("""
+        INSERT OR IGNORE INTO outages (date, queue, slots, last_updated) VALUES (?, ?, ?, ?)
+        """, outages)
+        conn.executemany("""
+        INSERT INTO history (date, queue, added, removed, changed_at) VALUES (?, ?, ?, ?, ?)
+        """, history)
+
+def bench_parse(fixtures, min_time):
+    """parse_schedule на кожній сторінці"""
+    results = {}
+    
+    for name, (today, tomorrow) in fixtures.items():
+        stats = measure(lambda: parser.parse_schedule(today), min_time)
+        stats["page_bytes"] = len(today)
+        stats["queues"] = len(parser.parse_schedule(today))
+        stats["mb_per_second"] = len(today) / (stats["mean_ms"] / 1000) / 1_000_000
+        results[name] = stats
+    
+    return results
+
+async def bench_fetch(fixtures, min_time):
+    """fetch_outage_schedule повністю (запити, хеш, розбір) з підміненим сайтом"""
+    results = {}
+    
+    for name, (today, tomorrow) in fixtures.items():
+        def handler(request):
+            page = tomorrow if request.url.path.endswith("/grafik-na-zavtra") else today
+            return httpx.Response(200, content=page)
+        
+        source = Source("Бенчмарк", "https://bench.invalid/zmerinka", [])
+        parser._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        
+        async def fetch():
+            # Без збережених валідаторів кожна сторінка вважається новою
+            parser._page_validators = {}
+            parser._pending_validators.clear()
+            with quiet():
+                await parser.fetch_outage_schedule(source)
+        
+        results[name] = await measure_async(fetch, min_time)
+        await parser.close_http_client()
+    
+    parser._page_validators = {}
+    parser._pending_validators.clear()
+    return results
+
+def bench_storage(fixtures, history_sizes, workdir, min_time):
+    """save_schedule, save_schedules_bulk і get_schedule при різному розмірі історії"""
+    results = {}
+    today = datetime.now(TIMEZONE).strftime("%Y-%m-%d")
+    tomorrow = (datetime.now(TIMEZONE) + timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    # Два різні варіанти сторінок: кожне збереження - справжня зміна графіка
+    variants = [
+        {today: parser.parse_schedule(pages[0]), tomorrow: parser.parse_schedule(pages[1])}
+        for pages in fixtures.values()
+    ]
+    largest = max(variants, key=lambda data: sum(len(queues) for queues in data.values()))
+    alternate = {
+        date: {queue: time_ranges[1:] for queue, time_ranges in queues_data.items()}
+        for date, queues_data in largest.items()
+    }
+    queues = list(largest[today])
+    
+    for history_size in history_sizes:
+        use_database(os.path.join(workdir, f"bench_{history_size}.db"))
+        seed_history(history_size, queues)
+        
+        entry = {}
+        toggle = [0]
+        
+        def save_one():
+            toggle[0] ^= 1
+            time_ranges = ["08:00-10:00"] if toggle[0] else ["10:00-12:00"]
+            database.save_schedule(today, queues[0], time_ranges)
+        
+        def save_bulk():
+            toggle[0] ^= 1
+            database.save_schedules_bulk(largest if toggle[0] else alternate)
+        
+        def save_unchanged():
+            database.save_schedules_bulk(largest)
+        
+        with quiet():
+            entry["save_schedule"] = measure(save_one, min_time)
+            entry["save_schedules_bulk"] = measure(save_bulk, min_time)
+            entry["save_schedules_bulk"]["rows"] = sum(len(data) for data in largest.values())
+            database.save_schedules_bulk(largest)
+            entry["save_schedules_bulk_unchanged"] = measure(save_unchanged, min_time)
+        
+        keys = [(date, queue) for date in (today, tomorrow) for queue in queues]
+        position = [0]
+        
+        def read_cached():
+            date, queue = keys[position[0] % len(keys)]
+            position[0] += 1
+            database.get_schedule(date, queue)
+        
+        def read_uncached():
+            cache._replace_schedules({})
+            read_cached()
+        
+        entry["get_schedule_cached"] = measure(read_cached, min_time)
+        entry["get_schedule_uncached"] = measure(read_uncached, min_time)
+        
+        with quiet():
+            start = time.perf_counter()
+            database.compact_history(retention_days=36500)
+            entry["compact_history_ms"] = (time.perf_counter() - start) * 1000
+        
+        results[f"history_{history_size}"] = entry
+    
+    return results
+
+class StubBot:
+    """Заглушка бота: лише рахує повідомлення, за потреби імітує затримку мережі"""
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sent = 0
+    
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+async def bench_broadcast(recipients, quick):
+    """Пропускна здатність розсилки із заглушкою бота"""
+    results = {}
+    cases = [("no_latency", 0.0), ("latency_50ms", 0.05)]
+    
+    for case, latency in cases:
+        bot = StubBot(latency)
+        sender = broadcast.Broadcaster(bot)
+        # Без глобального ліміту: вимірюємо власні витрати черги і обробників
+        sender.bucket = broadcast.TokenBucket(1_000_000)
+        sender.start()
+        
+        start = time.perf_counter()
+        with quiet():
+            await sender.submit(range(recipients), "🔔 Бенчмарк", label=case).wait()
+        elapsed = time.perf_counter() - start
+        await sender.stop()
+        
+        results[case] = {
+            "messages": bot.sent,
+            "seconds": elapsed,
+            "messages_per_second": bot.sent / elapsed
+        }
+    
+    if not quick:
+        # Зі справжнім лімітом: швидкість має триматися біля BROADCAST_RATE_PER_SECOND
+        bot = StubBot()
+        sender = broadcast.Broadcaster(bot)
+        sender.start()
+        messages = broadcast.BROADCAST_RATE_PER_SECOND * 3
+        
+        start = time.perf_counter()
+        with quiet():
+            await sender.submit(range(messages), "🔔 Бенчмарк", label="rate_limited").wait()
+        elapsed = time.perf_counter() - start
+        await sender.stop()
+        
+        results["rate_limited"] = {
+            "messages": bot.sent,
+            "seconds": elapsed,
+            "messages_per_second": bot.sent / elapsed,
+            "configured_rate": broadcast.BROADCAST_RATE_PER_SECOND
+        }
+    
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def flatten(results, prefix=""):
+    """{"a": {"b": 1}} -> {"a.b": 1} для порівняння запусків"""
+    flat = {}
+    
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    
+    return flat
+
+def compare(old_path, results):
+    """Друкує зміну середнього часу і пропускної здатності відносно попереднього запуску"""
+    with open(old_path, encoding="utf-8") as f:
+        old = flatten(json.load(f)["results"])
+    new = flatten(results)
+    
+    print(f"\n📊 Порівняння з {old_path}:")
+    for name, value in new.items():
+        if not name.endswith(("mean_ms", "messages_per_second", "ops_per_second")):
+            continue
+        
+        previous = old.get(name)
+        if not previous:
+            continue
+        
+        change = (value - previous) / previous * 100
+        # Для часу гірше - більше, для швидкості - менше
+        worse = change > 10 if name.endswith("mean_ms") else change < -10
+        print(f"  {'⚠️' if worse else '  '} {name}: {previous:.3f} -> {value:.3f} ({change:+.1f}%)")
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Офлайн-бенчмарки бота")
+    arg_parser.add_argument("--output", default="bench_results.json", help="файл для результатів (JSON)")
+    arg_parser.add_argument("--compare", help="попередній файл результатів для порівняння")
+    arg_parser.add_argument("--fixtures", help="тека зі збереженими сторінками <назва>_today.html / <назва>_tomorrow.html")
+    arg_parser.add_argument("--save-fixtures", help="записати згенеровані сторінки в теку і вийти")
+    arg_parser.add_argument("--quick", action="store_true", help="коротший запуск (для швидкої перевірки)")
+    arg_parser.add_argument("--check", action="store_true", help="перевірити parse_schedule на збережених сторінках і вийти")
+    arg_parser.add_argument("--write-expected", action="store_true", help="записати очікувані результати (reference_parse, потрібен bs4) і вийти")
+    arg_parser.add_argument("--record", nargs="?", const=FIXTURES_DIR, metavar="DIR", help="зберегти справжні сторінки з сайту (потрібні мережа і bs4) і вийти")
+    args = arg_parser.parse_args()
+    
+    if args.record:
+        print(f"🌐 Збереження сторінок у {args.record}...")
+        record_pages(args.record)
+        return
+    
+    if args.write_expected:
+        write_expected(args.fixtures or FIXTURES_DIR)
+        print(f"✅ Очікувані результати записано в {args.fixtures or FIXTURES_DIR}")
+        return
+    
+    if args.check:
+        print("🔎 Перевірка parse_schedule...")
+        directory = args.fixtures or FIXTURES_DIR
+        parser_ok = check_parser(directory)
+        print("🔎 Перевірка масок графіків...")
+        slots_ok = check_slots(directory)
+        print("🔎 Перевірка /now на графіках з bot.db...")
+        power_now_ok = check_power_now(REAL_DB_PATH)
+        print("🔎 Перевірка нагадувань...")
+        if not (check_reminders() and power_now_ok and slots_ok and parser_ok):
+            sys.exit(1)
+        print("✅ Результати збігаються")
+        return
+    
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else generate_fixtures()
+    
+    if args.save_fixtures:
+        save_fixtures(fixtures, args.save_fixtures)
+        print(f"✅ Сторінки збережено в {args.save_fixtures}")
+        return
+    
+    # Справжня розмітка сайту - поряд зі згенерованими сторінками
+    recorded = {} if args.fixtures else load_fixtures(FIXTURES_DIR)
+    if not args.fixtures and not recorded:
+        print("⚠️ У fixtures/ немає збережених сторінок: лише згенеровані (python bench.py --record)")
+    fixtures.update(recorded)
+    
+    min_time = 0.2 if args.quick else 1.0
+    history_sizes = QUICK_HISTORY_SIZES if args.quick else HISTORY_SIZES
+    recipients = 2_000 if args.quick else 10_000
+    results = {}
+    
+    print("⏱️ Розбір сторінок...")
+    results["parse_schedule"] = bench_parse(fixtures, min_time)
+    
+    print("⏱️ fetch_outage_schedule (офлайн)...")
+    results["fetch_outage_schedule"] = asyncio.run(bench_fetch(fixtures, min_time))
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        print("⏱️ Збереження і читання графіків...")
+        results["storage"] = bench_storage(fixtures, history_sizes, workdir, min_time)
+        close_database()
+    
+    print("⏱️ Розсилка...")
+    results["broadcast"] = asyncio.run(bench_broadcast(recipients, args.quick))
+    
+    report = {
+        "meta": {
+            "created_at": datetime.now(TIMEZONE).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "quick": args.quick,
+            "fixtures": args.fixtures or ["generated", *recorded]
+        },
+        "results": results
+    }
+    
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    for name, value in flatten(results).items():
+        if name.endswith(("mean_ms", "messages_per_second", "mb_per_second")):
+            print(f"  {name}: {value:.3f}")
+    
+    print(f"✅ Результати збережено в {args.output}")
+    
+    if args.compare:
+        compare(args.compare, results)
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
 # bot.py - Головний файл Telegram бота з підтримкою підчерг
 
+import time
+
+# Відлік часу запуску - до імпорту бібліотек
+_started_at = time.perf_counter()
+
 from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import (
     ApplicationBuilder,
@@ -10,21 +15,101 @@ from telegram.ext import (
     ConversationHandler
 )
 from datetime import datetime, timedelta
+import asyncio
+import html
+import sys
 import traceback
 
-from config import BOT_TOKEN, QUEUES, CITY
+from config import (
+    BOT_TOKEN,
+    CITY,
+    TIMEZONE,
+    MANUAL_REFRESH_COOLDOWN_SECONDS,
+    ADMIN_IDS,
+    METRICS_HOST,
+    METRICS_PORT,
+    FIRST_CHECK_DELAY_SECONDS,
+    BOT_MODE,
+    ALLOWED_UPDATES,
+    UPDATE_WORKERS,
+    UPDATE_MAX_PENDING
+)
 from database import (
     init_db,
     save_user,
     get_user,
     update_user_queue,
+    update_user_city,
     update_user_notify,
-    get_schedule
+    get_subscriptions,
+    add_subscription,
+    remove_subscription,
+    get_schedule,
+    warm_caches
+)
+from sources import SOURCES, get_source
+from cache import add_schedule_listener
+from timeline import update_schedules as update_timeline, power_status, to_minute, from_minute
+from webhook import run_webhook
+from updates import PerChatUpdateProcessor
+from messages import get_message, prerender
+from metrics import HANDLER_SECONDS, render_summary, start_metrics_server, stop_metrics_server
+from broadcast import start_broadcaster, stop_broadcaster
+from notifications import start_notifications, cancel_pending as cancel_pending_notifications
+from outbox import start_outbox, stop_outbox
+from reminders import start_reminders, stop_reminders, on_schedules_changed as reschedule_reminders
+from scheduler import (
+    start_scheduler,
+    stop_scheduler,
+    set_bot_application,
+    check_updates,
+    get_fresh_check_time
 )
-from parser import fetch_outage_schedule, format_schedule
-from scheduler import start_scheduler, stop_scheduler, set_bot_application, check_updates
 
 CHOOSING_QUEUE = 1
+CHOOSING_CITY = 2
+ADDING_QUEUE = 3
+REMOVING_QUEUE = 4
+
+# chat_id -> час останнього ручного оновлення (time.monotonic)
+last_refresh_request = {}
+
+# Етапи запуску: [(назва, секунди)]
+_startup_phases = []
+_phase_started_at = _started_at
+
+def startup_phase(name):
+    """Фіксує тривалість етапу запуску (від кінця попереднього)"""
+    global _phase_started_at
+    now = time.perf_counter()
+    _startup_phases.append((name, now - _phase_started_at))
+    _phase_started_at = now
+
+# Кнопки меню -> назва команди в метриках
+MENU_COMMANDS = {
+    "📋 Графік на сьогодні": "today",
+    "📅 Графік на завтра": "tomorrow",
+    "⚙️ Обрати чергу": "queue",
+    "➕ Додати чергу": "add",
+    "➖ Видалити чергу": "remove",
+    "🏙 Обрати місто": "city",
+    "🔄 Оновити графік": "update",
+    "ℹ️ Про бота": "about"
+}
+
+def measured(command, callback):
+    """Обгортка обробника: час виконання потрапляє в bot_handler_seconds{command}"""
+    
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        name = command or MENU_COMMANDS.get(update.message.text if update.message else None, "text")
+        with HANDLER_SECONDS.time(name):
+            return await callback(update, context)
+    
+    return wrapper
+
+def format_subscriptions(subscriptions):
+    """Список черг для повідомлень (усі підписки - в місті користувача)"""
+    return ", ".join(queue for _, queue in subscriptions)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
@@ -34,17 +119,22 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if not user:
         save_user(chat_id)
+        user = get_user(chat_id)
+    elif not user[3]:
+        # Сповіщення вимикаються, коли бота заблоковано; /start після розблокування їх повертає
+        update_user_notify(chat_id, 1)
     
     keyboard = [
         ["📋 Графік на сьогодні", "📅 Графік на завтра"],
         ["⚙️ Обрати чергу", "🔄 Оновити графік"],
-        ["ℹ️ Про бота"]
+        ["➕ Додати чергу", "➖ Видалити чергу"],
+        ["🏙 Обрати місто", "ℹ️ Про бота"]
     ]
     
     welcome_text = f"""
 👋 <b>Вітаю!</b>
 
-Я бот графіків відключень електроенергії для міста <b>{CITY}</b>.
+Я бот графіків відключень електроенергії для міста <b>{user[1]}</b>.
 
 📌 <b>Що я вмію:</b>
 - Показувати актуальний графік відключень
@@ -54,8 +144,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 ⚡ <b>Оберіть дію з меню нижче</b>
 """
     
-    if user and user[2]:
-        welcome_text += f"\n✅ Ваша черга: <b>{user[2]}</b>"
+    subscriptions = get_subscriptions(chat_id)
+    
+    if len(subscriptions) > 1:
+        welcome_text += f"\n✅ Ваші черги: <b>{format_subscriptions(subscriptions)}</b>"
+    elif subscriptions:
+        welcome_text += f"\n✅ Ваша черга: <b>{subscriptions[0][1]}</b>"
     else:
         welcome_text += "\n⚠️ Оберіть свою чергу: '⚙️ Обрати чергу'"
     
@@ -77,49 +171,135 @@ async def show_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE, days
     """Показує графік відключень"""
     
     chat_id = update.effective_chat.id
-    user = get_user(chat_id)
+    subscriptions = get_subscriptions(chat_id)
     
-    if not user or not user[2]:
+    if not subscriptions:
         await update.message.reply_text(
             "⚠️ Спочатку оберіть свою чергу: '⚙️ Обрати чергу'",
             parse_mode="HTML"
         )
         return
     
-    user_queue = user[2]
-    
-    target_date = datetime.now() + timedelta(days=days_offset)
+    target_date = datetime.now(TIMEZONE) + timedelta(days=days_offset)
     date_str = target_date.strftime("%Y-%m-%d")
-    date_readable = target_date.strftime("%d.%m.%Y")
-    day_name = "сьогодні" if days_offset == 0 else "завтра"
+    kind = "today" if days_offset == 0 else "tomorrow"
     
-    schedule = get_schedule(date_str, user_queue)
+    # Усі черги користувача - одним повідомленням
+    message = "".join(get_message(city, date_str, queue, kind) for city, queue in subscriptions)
     
-    if schedule is None:
-        message = f"""
-📅 <b>Графік на {day_name} ({date_readable})</b>
-🔢 Черга: {user_queue}
+    await update.message.reply_text(message, parse_mode="HTML")
 
-⚠️ Дані ще не завантажені. Натисніть '🔄 Оновити графік'
-"""
+async def power_now(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Чи є світло зараз і коли наступна зміна (/now)"""
+    
+    chat_id = update.effective_chat.id
+    subscriptions = get_subscriptions(chat_id)
+    
+    if not subscriptions:
+        await update.message.reply_text(
+            "⚠️ Спочатку оберіть свою чергу: '⚙️ Обрати чергу'",
+            parse_mode="HTML"
+        )
+        return
+    
+    now = datetime.now(TIMEZONE)
+    sections = [power_status_text(city, queue, now) for city, queue in subscriptions]
+    
+    await update.message.reply_text("\n\n➖➖➖\n\n".join(sections), parse_mode="HTML")
+
+def power_status_text(city, user_queue, now):
+    """Стан світла для однієї черги: чи є зараз і коли наступна зміна"""
+    
+    # Графіки беруться з кешу; після старту перший запит дозавантажує їх з БД,
+    # і індекс черги перебудовується автоматично
+    for days_offset in (0, 1):
+        get_schedule((now + timedelta(days=days_offset)).strftime("%Y-%m-%d"), user_queue, city)
+    
+    status = power_status(city, user_queue, to_minute(now))
+    
+    if status is None:
+        return (
+            f"🔢 Черга: {user_queue}\n\n"
+            "⚠️ Дані ще не завантажені. Натисніть '🔄 Оновити графік'"
+        )
+    
+    is_off, next_change = status
+    
+    if is_off:
+        message = f"🔢 Черга: {user_queue}\n\n🔴 <b>Зараз світла немає</b>"
+        next_label = "Увімкнення"
     else:
-        schedule_text = format_schedule(schedule)
-        message = f"""
-📅 <b>Графік на {day_name} ({date_readable})</b>
-🔢 Черга: {user_queue}
+        message = f"🔢 Черга: {user_queue}\n\n💡 <b>Зараз світло є</b>"
+        next_label = "Наступне відключення"
+    
+    if next_change is None:
+        message += f"\n\n⏰ {next_label}: немає даних у графіку"
+    else:
+        change_at = from_minute(next_change)
+        minutes_left = next_change - to_minute(now)
+        day = "сьогодні" if change_at.date() == now.date() else "завтра"
+        message += (
+            f"\n\n⏰ {next_label}: {day} о {change_at.strftime('%H:%M')}"
+            f" (через {minutes_left // 60} год {minutes_left % 60} хв)"
+        )
+    
+    return message
 
-{schedule_text}
-"""
+def get_user_source(chat_id):
+    """Джерело графіків для міста користувача"""
+    user = get_user(chat_id)
+    return get_source(user[1] if user else CITY)
+
+async def choose_city_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Вибір міста"""
     
-    await update.message.reply_text(message, parse_mode="HTML")
+    cities = list(SOURCES)
+    keyboard = [cities[i:i+2] for i in range(0, len(cities), 2)]
+    keyboard.append(["❌ Скасувати"])
+    
+    await update.message.reply_text(
+        "🏙 <b>Оберіть ваше місто:</b>",
+        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+        parse_mode="HTML"
+    )
+    
+    return CHOOSING_CITY
+
+async def choose_city_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Збереження обраного міста і перехід до вибору черги"""
+    
+    user_choice = update.message.text
+    chat_id = update.effective_chat.id
+    
+    if user_choice == "❌ Скасувати":
+        await return_to_main_menu(update, context)
+        return ConversationHandler.END
+    
+    if user_choice not in SOURCES:
+        await update.message.reply_text(
+            "❌ Неправильний вибір. Оберіть місто з кнопок."
+        )
+        return CHOOSING_CITY
+    
+    if not get_user(chat_id):
+        save_user(chat_id, city=user_choice)
+    else:
+        update_user_city(chat_id, user_choice)
+    
+    await update.message.reply_text(f"✅ Ваше місто: <b>{user_choice}</b>", parse_mode="HTML")
+    
+    # У кожного міста свої черги - одразу пропонуємо обрати нову
+    return await choose_queue_start(update, context)
 
 async def choose_queue_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Вибір черги"""
     
+    queues = get_user_source(update.effective_chat.id).queues
+    
     # Створюємо клавіатуру з підчергами по 3 в ряд
     keyboard = []
-    for i in range(0, len(QUEUES), 3):
-        row = QUEUES[i:i+3]
+    for i in range(0, len(queues), 3):
+        row = queues[i:i+3]
         keyboard.append(row)
     keyboard.append(["❌ Скасувати"])
     
@@ -142,7 +322,7 @@ async def choose_queue_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await return_to_main_menu(update, context)
         return ConversationHandler.END
     
-    if user_choice not in QUEUES:
+    if user_choice not in get_user_source(chat_id).queues:
         await update.message.reply_text(
             "❌ Неправильний вибір. Оберіть чергу з кнопок."
         )
@@ -153,7 +333,8 @@ async def choose_queue_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = [
         ["📋 Графік на сьогодні", "📅 Графік на завтра"],
         ["⚙️ Обрати чергу", "🔄 Оновити графік"],
-        ["ℹ️ Про бота"]
+        ["➕ Додати чергу", "➖ Видалити чергу"],
+        ["🏙 Обрати місто", "ℹ️ Про бота"]
     ]
     
     await update.message.reply_text(
@@ -165,24 +346,147 @@ async def choose_queue_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return ConversationHandler.END
 
+async def add_queue_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Додавання ще однієї черги (інша адреса)"""
+    
+    chat_id = update.effective_chat.id
+    if not get_user(chat_id):
+        save_user(chat_id)
+    
+    source = get_user_source(chat_id)
+    subscribed = set(get_subscriptions(chat_id))
+    queues = [queue for queue in source.queues if (source.city, queue) not in subscribed]
+    
+    if not queues:
+        await update.message.reply_text("✅ Ви вже підписані на всі черги міста.")
+        return ConversationHandler.END
+    
+    keyboard = [queues[i:i+3] for i in range(0, len(queues), 3)]
+    keyboard.append(["❌ Скасувати"])
+    
+    await update.message.reply_text(
+        "➕ <b>Оберіть чергу, яку додати:</b>\n\n"
+        "Сповіщення про всі ваші черги приходитимуть одним повідомленням",
+        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+        parse_mode="HTML"
+    )
+    
+    return ADDING_QUEUE
+
+async def add_queue_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Збереження додаткової черги"""
+    
+    user_choice = update.message.text
+    chat_id = update.effective_chat.id
+    
+    if user_choice == "❌ Скасувати":
+        await return_to_main_menu(update, context)
+        return ConversationHandler.END
+    
+    source = get_user_source(chat_id)
+    
+    if user_choice not in source.queues:
+        await update.message.reply_text(
+            "❌ Неправильний вибір. Оберіть чергу з кнопок."
+        )
+        return ADDING_QUEUE
+    
+    add_subscription(chat_id, source.city, user_choice)
+    
+    await reply_with_subscriptions(update, f"✅ Чергу <b>{user_choice}</b> додано.")
+    return ConversationHandler.END
+
+async def remove_queue_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Видалення однієї з черг"""
+    
+    subscriptions = get_subscriptions(update.effective_chat.id)
+    
+    if not subscriptions:
+        await update.message.reply_text("⚠️ Ви ще не обрали жодної черги.")
+        return ConversationHandler.END
+    
+    queues = [queue for _, queue in subscriptions]
+    keyboard = [queues[i:i+3] for i in range(0, len(queues), 3)]
+    keyboard.append(["❌ Скасувати"])
+    
+    await update.message.reply_text(
+        "➖ <b>Оберіть чергу, яку видалити:</b>",
+        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+        parse_mode="HTML"
+    )
+    
+    return REMOVING_QUEUE
+
+async def remove_queue_done(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Видалення обраної черги з підписок"""
+    
+    user_choice = update.message.text
+    chat_id = update.effective_chat.id
+    
+    if user_choice == "❌ Скасувати":
+        await return_to_main_menu(update, context)
+        return ConversationHandler.END
+    
+    cities = [city for city, queue in get_subscriptions(chat_id) if queue == user_choice]
+    
+    if not cities:
+        await update.message.reply_text(
+            "❌ Неправильний вибір. Оберіть чергу з кнопок."
+        )
+        return REMOVING_QUEUE
+    
+    remove_subscription(chat_id, cities[0], user_choice)
+    
+    await reply_with_subscriptions(update, f"✅ Чергу <b>{user_choice}</b> видалено.")
+    return ConversationHandler.END
+
+async def reply_with_subscriptions(update: Update, text):
+    """Відповідь зі списком черг користувача і головним меню"""
+    
+    subscriptions = get_subscriptions(update.effective_chat.id)
+    
+    if subscriptions:
+        text += f"\n\n🔢 Ваші черги: <b>{format_subscriptions(subscriptions)}</b>"
+    else:
+        text += "\n\n⚠️ Ви не підписані на жодну чергу: '➕ Додати чергу'"
+    
+    keyboard = [
+        ["📋 Графік на сьогодні", "📅 Графік на завтра"],
+        ["⚙️ Обрати чергу", "🔄 Оновити графік"],
+        ["➕ Додати чергу", "➖ Видалити чергу"],
+        ["🏙 Обрати місто", "ℹ️ Про бота"]
+    ]
+    
+    await update.message.reply_text(
+        text,
+        reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True),
+        parse_mode="HTML"
+    )
+
 async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Про бота"""
     
-    message = """
+    source = get_user_source(update.effective_chat.id)
+    
+    message = f"""
 ℹ️ <b>Про бота</b>
 
-Бот допомагає відстежувати графіки відключень електроенергії в місті Жмеринка.
+Бот допомагає відстежувати графіки відключень електроенергії в місті {source.city}.
 
 <b>Джерело даних:</b>
-bezsvitla.com.ua
+{source.host}
 
 <b>Функції:</b>
 - Автоматичне оновлення графіків
-- Підтримка всіх підчерг (1.1, 2.1, 2.2, тощо)
+- Підтримка всіх підчерг ({", ".join(source.queues[:3])}, тощо)
 - Графік на сьогодні та завтра
 
 <b>Команди:</b>
 /start - Головне меню
+/now - Чи є світло зараз
+/city - Обрати місто
+/add - Додати ще одну чергу
+/remove - Видалити чергу
 /update - Оновити графік
 /help - Допомога
 
@@ -194,12 +498,42 @@ bezsvitla.com.ua
 async def force_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Оновлення графіка"""
     
+    chat_id = update.effective_chat.id
+    now = time.monotonic()
+    last_request = last_refresh_request.get(chat_id)
+    
+    if last_request is not None and now - last_request < MANUAL_REFRESH_COOLDOWN_SECONDS:
+        wait = int(MANUAL_REFRESH_COOLDOWN_SECONDS - (now - last_request)) + 1
+        await update.message.reply_text(
+            f"⏳ Ви щойно оновлювали графіки. Спробуйте ще раз через {wait} с."
+        )
+        return
+    
+    last_refresh_request[chat_id] = now
+    
+    # Нещодавня перевірка: відповідаємо одразу, без звернення до сайту
+    checked_at = get_fresh_check_time()
+    
+    if checked_at is not None:
+        await update.message.reply_text(
+            f"✅ Графіки актуальні (перевірено о {checked_at.strftime('%H:%M')})",
+            parse_mode="HTML"
+        )
+        return
+    
     await update.message.reply_text("🔄 Оновлюю графіки, зачекайте...")
     
     try:
-        check_updates()
+        # Усі одночасні запити чекають на одну спільну перевірку
+        if not await check_updates():
+            await update.message.reply_text(
+                "❌ Не вдалося завантажити графіки.\n\nСпробуйте пізніше.",
+                parse_mode="HTML"
+            )
+            return
+        
         await update.message.reply_text(
-            "✅ Графіки оновлено!\n\n"
+            f"✅ Графіки оновлено о {datetime.now(TIMEZONE).strftime('%H:%M')}!\n\n"
             "Тепер ви можете переглянути актуальну інформацію.",
             parse_mode="HTML"
         )
@@ -212,7 +546,9 @@ async def force_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Допомога"""
     
-    message = """
+    source = get_user_source(update.effective_chat.id)
+    
+    message = f"""
 📖 <b>Допомога</b>
 
 <b>Як користуватись:</b>
@@ -221,24 +557,46 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 2️⃣ Перегляньте графік на сьогодні або завтра
 3️⃣ Оновлюйте дані за потреби
 
+<b>Кілька адрес?</b>
+Додайте черги кнопкою '➕ Додати чергу' - графіки і сповіщення
+для всіх них приходитимуть одним повідомленням.
+
 <b>Де дізнатись свою чергу?</b>
-- На сайті bezsvitla.com.ua
+- На сайті {source.host}
 - У графіку від Вінницяобленерго
 - У додатку "Світло"
 
-<b>Доступні черги:</b>
-1.1, 2.1, 2.2, 3.1, 3.2, 4.2, 5.1, 6.1, 6.2
+<b>Доступні черги ({source.city}):</b>
+{", ".join(source.queues)}
 """
     
     await update.message.reply_text(message, parse_mode="HTML")
 
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Метрики бота (/stats, лише для адміністраторів)"""
+    
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text(
+            "❓ Використовуйте кнопки меню."
+        )
+        return
+    
+    # Обмеження Telegram - 4096 символів на повідомлення
+    summary = html.escape(render_summary()[:3800])
+    
+    await update.message.reply_text(
+        f"📈 <b>Статистика</b>\n\n<pre>{summary}</pre>",
+        parse_mode="HTML"
+    )
+
 async def return_to_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Головне меню"""
     
     keyboard = [
         ["📋 Графік на сьогодні", "📅 Графік на завтра"],
         ["⚙️ Обрати чергу", "🔄 Оновити графік"],
-        ["ℹ️ Про бота"]
+        ["➕ Додати чергу", "➖ Видалити чергу"],
+        ["🏙 Обрати місто", "ℹ️ Про бота"]
     ]
     
     await update.message.reply_text(
@@ -257,6 +615,12 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_schedule_tomorrow(update, context)
     elif text == "⚙️ Обрати чергу":
         await choose_queue_start(update, context)
+    elif text == "➕ Додати чергу":
+        await add_queue_start(update, context)
+    elif text == "➖ Видалити чергу":
+        await remove_queue_start(update, context)
+    elif text == "🏙 Обрати місто":
+        await choose_city_start(update, context)
     elif text == "ℹ️ Про бота":
         await about(update, context)
     elif text == "🔄 Оновити графік":
@@ -276,36 +640,115 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "😔 Сталася помилка. Спробуйте ще раз."
         )
 
+async def on_startup(app):
+    """Запуск фонових задач після старту циклу подій"""
+    startup_phase("підключення до Telegram")
+    
+    start_broadcaster(app.bot)
+    start_outbox()
+    start_reminders()
+    
+    if METRICS_PORT:
+        await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    
+    startup_phase("фонові задачі")
+    
+    # Графіки, користувачі і готові тексти з БД: бот відповідає одразу,
+    # не чекаючи першої перевірки сайту (індекс /now і нагадування теж готові)
+    now = datetime.now(TIMEZONE)
+    dates = [(now + timedelta(days=days_offset)).strftime("%Y-%m-%d") for days_offset in (0, 1)]
+    city_queues = [(source.city, queue) for source in SOURCES.values() for queue in source.queues]
+    schedules, users = warm_caches(dates, city_queues)
+    
+    for date, kind in zip(dates, ("today", "tomorrow")):
+        for city, queue in city_queues:
+            prerender(city, date, queue, [kind])
+    
+    startup_phase("кеші")
+    print(f"🔥 Кеш: {schedules} графіків, {users} користувачів")
+    
+    start_notifications()
+    
+    # Без графіків на сьогодні відповідати нічим - перевіряємо сайт одразу
+    has_today = any(get_schedule(dates[0], queue, city) is not None for city, queue in city_queues)
+    start_scheduler(FIRST_CHECK_DELAY_SECONDS if has_today else 0)
+    
+    startup_phase("планувальник")
+    
+    phases = ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in _startup_phases)
+    print(f"⏱ Запуск за {time.perf_counter() - _started_at:.2f} с: {phases}")
+
+async def on_shutdown(app):
+    """Зупинка фонових задач"""
+    stop_scheduler()
+    cancel_pending_notifications()
+    await stop_reminders()
+    await stop_broadcaster()
+    await stop_outbox()
+    await stop_metrics_server()
+    
+    # parser.py (і HTTP-клієнт) є, лише якщо вже була перевірка
+    if "parser" in sys.modules:
+        from parser import close_http_client
+        await close_http_client()
+
 def main():
     """Запуск бота"""
     
+    startup_phase("імпорти")
     print("🤖 Запуск бота...")
     
     init_db()
-    
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    startup_phase("база даних")
+    
+    app = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(PerChatUpdateProcessor(UPDATE_WORKERS, UPDATE_MAX_PENDING))
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     
     set_bot_application(app)
-    start_scheduler()
+    add_schedule_listener(update_timeline)
+    add_schedule_listener(reschedule_reminders)
     
     queue_conv_handler = ConversationHandler(
-        entry_points=[MessageHandler(filters.Regex("^⚙️ Обрати чергу$"), choose_queue_start)],
+        entry_points=[
+            MessageHandler(filters.Regex("^⚙️ Обрати чергу$"), measured("queue", choose_queue_start)),
+            MessageHandler(filters.Regex("^🏙 Обрати місто$"), measured("city", choose_city_start)),
+            MessageHandler(filters.Regex("^➕ Додати чергу$"), measured("add", add_queue_start)),
+            MessageHandler(filters.Regex("^➖ Видалити чергу$"), measured("remove", remove_queue_start)),
+            CommandHandler("city", measured("city", choose_city_start)),
+            CommandHandler("add", measured("add", add_queue_start)),
+            CommandHandler("remove", measured("remove", remove_queue_start))
+        ],
         states={
-            CHOOSING_QUEUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, choose_queue_done)]
+            CHOOSING_QUEUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, measured("choose_queue", choose_queue_done))],
+            CHOOSING_CITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, measured("choose_city", choose_city_done))],
+            ADDING_QUEUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, measured("add_queue", add_queue_done))],
+            REMOVING_QUEUE: [MessageHandler(filters.TEXT & ~filters.COMMAND, measured("remove_queue", remove_queue_done))]
         },
         fallbacks=[MessageHandler(filters.Regex("^❌ Скасувати$"), return_to_main_menu)]
     )
     
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("update", force_update))
+    app.add_handler(CommandHandler("start", measured("start", start)))
+    app.add_handler(CommandHandler("help", measured("help", help_command)))
+    app.add_handler(CommandHandler("update", measured("update", force_update)))
+    app.add_handler(CommandHandler("now", measured("now", power_now)))
+    app.add_handler(CommandHandler("stats", stats))
     app.add_handler(queue_conv_handler)
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, measured(None, handle_text)))
     app.add_error_handler(error_handler)
     
+    startup_phase("обробники")
     print("✅ Бот запущено! Натисніть Ctrl+C для зупинки.")
     
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(app))
+    else:
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == "__main__":
     try:
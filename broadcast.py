@@ -0,0 +1,210 @@
+# broadcast.py - Розсилка сповіщень з обмеженням швидкості
+
+import asyncio
+import itertools
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+from config import (
+    BROADCAST_RATE_PER_SECOND,
+    BROADCAST_PER_CHAT_INTERVAL,
+    BROADCAST_WORKERS,
+    BROADCAST_MAX_RETRIES
+)
+from metrics import QUEUE_DEPTH, SEND_SECONDS, MESSAGES_SENT, SEND_ERRORS
+
+class TokenBucket:
+    """Глобальний ліміт відправок (токен-бакет) з паузою після 429"""
+    
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+    
+    def pause(self, seconds):
+        """Зупиняє всі відправки на вказаний час (retry_after від Telegram)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+    
+    async def acquire(self):
+        """Чекає на вільний токен"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Broadcast:
+    """Стан однієї розсилки: скільки доставлено і скільки з помилками"""
+    
+    def __init__(self, broadcast_id, total, label, on_result=None):
+        self.id = broadcast_id
+        self.total = total
+        self.label = label
+        # on_result(chat_id, доставлено, помилка) - для кожного одержувача
+        self.on_result = on_result
+        self.delivered = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.done = asyncio.Event()
+        
+        if total == 0:
+            self.done.set()
+    
+    def record(self, chat_id, delivered, error=None):
+        """Фіксує результат відправки одному користувачу"""
+        if self.on_result is not None:
+            self.on_result(chat_id, delivered, error)
+        
+        if delivered:
+            self.delivered += 1
+        else:
+            self.failed += 1
+        
+        if self.delivered + self.failed >= self.total:
+            elapsed = time.monotonic() - self.started_at
+            print(
+                f"📨 Розсилка #{self.id} ({self.label}): доставлено {self.delivered}, "
+                f"помилок {self.failed}, {elapsed:.1f} с"
+            )
+            self.done.set()
+    
+    async def wait(self):
+        """Чекає завершення розсилки, повертає (доставлено, помилок)"""
+        await self.done.wait()
+        return self.delivered, self.failed
+
+class Broadcaster:
+    """Черга відправок з глобальним і per-chat обмеженням швидкості"""
+    
+    def __init__(self, bot):
+        self.bot = bot
+        self.queue = asyncio.Queue()
+        self.bucket = TokenBucket(BROADCAST_RATE_PER_SECOND)
+        self.chat_ready_at = {}
+        self.workers = []
+        self.ids = itertools.count(1)
+    
+    def start(self):
+        """Запускає обробників черги"""
+        loop = asyncio.get_running_loop()
+        self.workers = [loop.create_task(self._worker()) for _ in range(BROADCAST_WORKERS)]
+    
+    async def stop(self):
+        """Зупиняє обробників черги"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    def submit(self, chat_ids, text, label="", on_result=None):
+        """Ставить розсилку в чергу, повертає Broadcast"""
+        chat_ids = list(chat_ids)
+        job = Broadcast(next(self.ids), len(chat_ids), label, on_result)
+        
+        for chat_id in chat_ids:
+            self.queue.put_nowait((job, chat_id, text, 0))
+        
+        return job
+    
+    def _retry_later(self, item, delay):
+        """Повертає відправку в чергу через delay секунд"""
+        asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, item)
+    
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            
+            try:
+                await self._deliver(item)
+            except Exception as e:
+                item[0].record(item[1], False, e)
+                print(f"❌ Помилка розсилки {item[1]}: {e}")
+            finally:
+                self.queue.task_done()
+    
+    async def _deliver(self, item):
+        job, chat_id, text, attempt = item
+        
+        # Не частіше одного повідомлення на чат за BROADCAST_PER_CHAT_INTERVAL
+        wait = self.chat_ready_at.get(chat_id, 0) - time.monotonic()
+        if wait > 0:
+            self._retry_later(item, wait)
+            return
+        
+        await self.bucket.acquire()
+        self.chat_ready_at[chat_id] = time.monotonic() + BROADCAST_PER_CHAT_INTERVAL
+        
+        try:
+            with SEND_SECONDS.time():
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+        except RetryAfter as e:
+            SEND_ERRORS.inc("RetryAfter")
+            retry_after = e.retry_after
+            if not isinstance(retry_after, (int, float)):
+                retry_after = retry_after.total_seconds()
+            
+            print(f"⏳ Telegram просить зачекати {retry_after} с")
+            self.bucket.pause(retry_after)
+            self._retry_later((job, chat_id, text, attempt), retry_after)
+            return
+        except (Forbidden, BadRequest) as e:
+            SEND_ERRORS.inc(type(e).__name__)
+            print(f"❌ Помилка відправки {chat_id}: {e}")
+            job.record(chat_id, False, e)
+            return
+        except NetworkError as e:
+            SEND_ERRORS.inc(type(e).__name__)
+            if attempt + 1 >= BROADCAST_MAX_RETRIES:
+                print(f"❌ Помилка відправки {chat_id}: {e}")
+                job.record(chat_id, False, e)
+                return
+            
+            self._retry_later((job, chat_id, text, attempt + 1), min(60, 2 ** attempt))
+            return
+        
+        job.record(chat_id, True)
+        MESSAGES_SENT.inc()
+        
+        if len(self.chat_ready_at) > 10000:
+            now = time.monotonic()
+            self.chat_ready_at = {c: t for c, t in self.chat_ready_at.items() if t > now}
+
+broadcaster = None
+
+def start_broadcaster(bot):
+    """Запуск розсилки (викликати з циклу подій бота)"""
+    global broadcaster
+    broadcaster = Broadcaster(bot)
+    broadcaster.start()
+    QUEUE_DEPTH.set_function(broadcaster.queue.qsize)
+    print(f"✅ Розсилку запущено ({BROADCAST_RATE_PER_SECOND} повідомлень/с)")
+
+async def stop_broadcaster():
+    """Зупинка розсилки"""
+    if broadcaster:
+        await broadcaster.stop()
+
+def broadcast(chat_ids, text, label="", on_result=None):
+    """Надсилає повідомлення списку користувачів через чергу розсилки"""
+    if broadcaster is None:
+        raise RuntimeError("Розсилку не запущено")
+    return broadcaster.submit(chat_ids, text, label, on_result)
+
+def pending_count():
+    """Скільки відправок чекає в черзі розсилки"""
+    return broadcaster.queue.qsize() if broadcaster else 0
@@ -0,0 +1,91 @@
+# cache.py - Кеш графіків і користувачів у пам'яті
+
+import threading
+
+_lock = threading.Lock()
+
+# (місто, дата, черга) -> (версія, [проміжки] або None, якщо графіка немає)
+_schedules = {}
+# Загальний лічильник версій, зростає з кожним записом у кеш
+version = 0
+
+# chat_id -> рядок таблиці users
+_users = {}
+# chat_id -> [(місто, черга)] з таблиці subscriptions
+_subscriptions = {}
+
+# Викликаються з [(місто, дата, черга, графік)] після кожного запису графіків
+_listeners = []
+
+def add_schedule_listener(callback):
+    """Підписує callback на зміни графіків у кеші"""
+    _listeners.append(callback)
+
+def get_cached_schedule(city, date, queue):
+    """Повертає (знайдено, графік) з кешу"""
+    entry = _schedules.get((city, date, queue))
+    
+    if entry is None:
+        return False, None
+    return True, entry[1]
+
+def get_schedule_version(city, date, queue):
+    """Версія запису в кеші (0, якщо запису немає)"""
+    entry = _schedules.get((city, date, queue))
+    return entry[0] if entry else 0
+
+def put_schedules(items):
+    """Атомарно записує [(місто, дата, черга, графік)] у кеш, повертає нову версію"""
+    global version
+    
+    with _lock:
+        version += 1
+        updated = dict(_schedules)
+        
+        for city, date, queue, time_ranges in items:
+            updated[(city, date, queue)] = (version, time_ranges)
+        
+        _replace_schedules(updated)
+        new_version = version
+    
+    for callback in _listeners:
+        callback(items)
+    
+    return new_version
+
+def evict_schedules_before(date):
+    """Видаляє з кешу графіки на дати, раніші за вказану"""
+    with _lock:
+        kept = {key: entry for key, entry in _schedules.items() if key[1] >= date}
+        removed = len(_schedules) - len(kept)
+        _replace_schedules(kept)
+    
+    return removed
+
+def _replace_schedules(updated):
+    # Читачі бачать або старий, або новий словник повністю
+    global _schedules
+    _schedules = updated
+
+def get_cached_user(chat_id):
+    """Повертає (знайдено, користувач) з кешу"""
+    if chat_id in _users:
+        return True, _users[chat_id]
+    return False, None
+
+def put_user(chat_id, row):
+    """Записує рядок користувача в кеш"""
+    _users[chat_id] = row
+
+def get_cached_subscriptions(chat_id):
+    """Повертає підписки користувача з кешу або None"""
+    return _subscriptions.get(chat_id)
+
+def put_subscriptions(chat_id, subscriptions):
+    """Записує підписки користувача в кеш"""
+    _subscriptions[chat_id] = subscriptions
+
+def forget_user(chat_id):
+    """Видаляє користувача і його підписки з кешу"""
+    _users.pop(chat_id, None)
+    _subscriptions.pop(chat_id, None)
@@ -1,7 +1,75 @@
 import os
+from zoneinfo import ZoneInfo
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "8423177523:AAF06dm8AOzgC0zZ2CyudSLeS9VOt-EmKNk")
 CITY = "Жмеринка"
+TIMEZONE = ZoneInfo("Europe/Kyiv")
 CHECK_INTERVAL_MINUTES = 10
 VOE_URL = "https://bezsvitla.com.ua/vinnytska-oblast/zmerinka"
 QUEUES = ["1.1", "2.1", "2.2", "3.1", "3.2", "4.2", "5.1", "6.1", "6.2"]
+
+# Адаптивний інтервал перевірки (CHECK_INTERVAL_MINUTES - початковий)
+# Профілі за часом доби: (з години, мінімум хв, максимум хв), діють до наступного профілю
+CHECK_PROFILES = [
+    (0, 15, 60),
+    (6, 2, 20)
+]
+# Без змін інтервал поступово зростає, після зміни - падає до мінімуму
+CHECK_BACKOFF_FACTOR = 1.5
+# Після помилок: мінімум * CHECK_FAILURE_FACTOR ** кількість помилок поспіль
+CHECK_FAILURE_FACTOR = 2
+# Випадкове відхилення інтервалу, частка (0.15 = ±15%)
+CHECK_JITTER = 0.15
+# Якщо графіки на сьогодні вже є в БД, перша перевірка після запуску відкладається,
+# щоб спершу відповісти користувачам, які писали під час перезапуску, с
+FIRST_CHECK_DELAY_SECONDS = 5
+
+# Отримання оновлень: "polling" або "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Лише ті типи оновлень, які бот обробляє
+ALLOWED_UPDATES = ["message"]
+# Скільки оновлень обробляти одночасно (оновлення одного чату - завжди по черзі)
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "16"))
+# Скільки оновлень може бути в роботі та в очікуванні разом
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "10000"))
+
+# Вебхук: без WEBHOOK_URL сервер працює, але setWebhook не викликається (локальна перевірка);
+# без WEBHOOK_URL і WEBHOOK_SECRET сервер слухає лише 127.0.0.1
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+
+# Адміністратори (chat_id через кому) - доступ до /stats
+ADMIN_IDS = {int(chat_id) for chat_id in os.getenv("ADMIN_IDS", "").split(",") if chat_id.strip()}
+
+# Ендпоінт метрик для Prometheus (порт 0 - вимкнено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Скільки сторінок одного сайту завантажувати одночасно
+MAX_CONNECTIONS_PER_HOST = 4
+
+# Ручне оновлення ("🔄 Оновити графік", /update)
+MANUAL_REFRESH_FRESHNESS_SECONDS = 120
+MANUAL_REFRESH_COOLDOWN_SECONDS = 60
+
+# Зміни графіків за цей час збираються в одне сповіщення, с
+NOTIFY_DEBOUNCE_SECONDS = 180
+
+# Нагадування перед відключенням і увімкненням
+REMINDER_MINUTES_BEFORE = 15
+
+# Історія змін: скільки днів зберігати окремі записи
+HISTORY_RETENTION_DAYS = 30
+
+# Розсилка сповіщень
+BROADCAST_RATE_PER_SECOND = 30
+BROADCAST_PER_CHAT_INTERVAL = 1.0
+BROADCAST_WORKERS = 8
+BROADCAST_MAX_RETRIES = 5
+# Скільки повідомлень з outbox передавати в розсилку за раз
+OUTBOX_BATCH_SIZE = 500
+# Скільки підписників читати з БД за раз під час розсилки
+FANOUT_CHUNK_SIZE = 1000
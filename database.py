@@ -2,14 +2,51 @@
 
 import sqlite3
 import json
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 
-conn = sqlite3.connect("bot.db", check_same_thread=False)
-cursor = conn.cursor()
+from config import CITY, FANOUT_CHUNK_SIZE
+from metrics import DB_READ_SECONDS, DB_WRITE_SECONDS, CACHE_REQUESTS
+from slots import ranges_to_mask, mask_to_ranges, mask_to_blob, blob_to_mask, diff_masks
+from cache import (
+    get_cached_schedule,
+    put_schedules,
+    get_cached_user,
+    put_user,
+    get_cached_subscriptions,
+    put_subscriptions,
+    forget_user
+)
+
+DB_PATH = "bot.db"
+
+# Кожен потік (цикл подій бота, потоки виконавця) має власне з'єднання
+_local = threading.local()
+
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    # WAL: читання не чекають на запис парсера
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-8000")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+def get_connection():
+    """Повертає з'єднання з БД для поточного потоку"""
+    conn = getattr(_local, "conn", None)
+    
+    if conn is None:
+        conn = _local.conn = _connect()
+    
+    return conn
 
 def init_db():
     """Створює таблиці в базі даних"""
     
+    conn = get_connection()
+    cursor = conn.cursor()
+    
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS users (
         chat_id INTEGER PRIMARY KEY,
@@ -22,109 +59,724 @@ def init_db():
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS outages (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        city TEXT DEFAULT 'Жмеринка',
         date TEXT,
         queue TEXT,
         time_ranges TEXT,
-        last_updated TEXT
+        last_updated TEXT,
+        slots BLOB
     )
     """)
     
+    _add_column(cursor, "outages", "city", "TEXT DEFAULT 'Жмеринка'")
+    _migrate_outages_to_slots(cursor)
+    
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS history (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        city TEXT DEFAULT 'Жмеринка',
+        date TEXT,
+        queue TEXT,
+        old_schedule TEXT,
+        new_schedule TEXT,
+        changed_at TEXT,
+        added TEXT,
+        removed TEXT
+    )
+    """)
+    
+    _add_column(cursor, "history", "added", "TEXT")
+    _add_column(cursor, "history", "removed", "TEXT")
+    _add_column(cursor, "history", "city", "TEXT DEFAULT 'Жмеринка'")
+    
+    # Підсумки змін за день для записів, старших за HISTORY_RETENTION_DAYS
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS history_daily (
+        city TEXT DEFAULT 'Жмеринка',
+        date TEXT,
+        queue TEXT,
+        changes INTEGER,
+        first_changed_at TEXT,
+        last_changed_at TEXT,
+        PRIMARY KEY (city, date, queue)
+    )
+    """)
+    
+    _migrate_history_daily_to_cities(cursor)
+    
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS page_cache (
+        url TEXT PRIMARY KEY,
+        date TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT,
+        checked_at TEXT
+    )
+    """)
+    
+    # Черги, на які підписаний користувач (може бути кілька адрес)
+    has_subscriptions = cursor.execute("""
+    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'subscriptions'
+    """).fetchone()
+    
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        chat_id INTEGER,
+        city TEXT,
+        queue TEXT,
+        PRIMARY KEY (chat_id, city, queue)
+    ) WITHOUT ROWID
+    """)
+    
+    # Покриваючий індекс для розсилки: підписники черги без читання таблиці
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_subscriptions_city_queue
+    ON subscriptions (city, queue, chat_id)
+    """)
+    
+    if not has_subscriptions:
+        _migrate_users_to_subscriptions(cursor)
+    
+    # Зміни графіків, про які ще не надіслано сповіщення (пишуться разом зі змінами)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        city TEXT,
         date TEXT,
         queue TEXT,
         old_schedule TEXT,
         new_schedule TEXT,
-        changed_at TEXT
+        created_at TEXT
+    )
+    """)
+    
+    # Докуди дійшло перетворення змін на повідомлення (один рядок): після помилки
+    # або перезапуску воно продовжується з наступного чату, без повторів
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS outbox_progress (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_change_id INTEGER,
+        last_chat_id INTEGER
+    )
+    """)
+    
+    # Готові повідомлення, що чекають на відправку
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS outbox_deliveries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER,
+        text TEXT,
+        label TEXT,
+        created_at TEXT
+    )
+    """)
+    
+    # Прибираємо можливі дублікати перед створенням унікального індексу
+    cursor.execute("""
+    DELETE FROM outages WHERE id NOT IN (
+        SELECT MAX(id) FROM outages GROUP BY city, date, queue
     )
     """)
     
+    # Графіки зберігаються окремо для кожного міста
+    cursor.execute("DROP INDEX IF EXISTS idx_outages_date_queue")
+    cursor.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_outages_city_date_queue
+    ON outages (city, date, queue)
+    """)
+    
+    # Розсилка йде через subscriptions - індекси users за чергою не потрібні
+    cursor.execute("DROP INDEX IF EXISTS idx_users_queue_notify")
+    cursor.execute("DROP INDEX IF EXISTS idx_users_city_queue_notify")
+    
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_history_changed_at
+    ON history (changed_at)
+    """)
+    
     conn.commit()
     print("✅ База даних ініціалізована")
 
-def save_user(chat_id, city="Жмеринка", queue=None, notify=1):
-    """Зберігає або оновлює дані користувача"""
+def _migrate_users_to_subscriptions(cursor):
+    """Переносить обрану раніше чергу кожного користувача в subscriptions"""
     cursor.execute("""
-    INSERT OR REPLACE INTO users (chat_id, city, queue, notify)
-    VALUES (?, ?, ?, ?)
-    """, (chat_id, city, queue, notify))
-    conn.commit()
+    INSERT OR IGNORE INTO subscriptions (chat_id, city, queue)
+    SELECT chat_id, city, CAST(queue AS TEXT) FROM users WHERE queue IS NOT NULL
+    """)
+    
+    if cursor.rowcount > 0:
+        print(f"🔄 Перенесено {cursor.rowcount} черг користувачів у підписки")
+
+def _add_column(cursor, table, column, definition):
+    """Додає стовпець до таблиці старої бази, якщо його ще немає"""
+    columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+    
+    if column not in columns:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _migrate_history_daily_to_cities(cursor):
+    """Переносить підсумки зі старої history_daily (без міста) у нову"""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(history_daily)")]
+    
+    if "city" in columns:
+        return
+    
+    cursor.execute("ALTER TABLE history_daily RENAME TO history_daily_old")
+    cursor.execute("""
+    CREATE TABLE history_daily (
+        city TEXT DEFAULT 'Жмеринка',
+        date TEXT,
+        queue TEXT,
+        changes INTEGER,
+        first_changed_at TEXT,
+        last_changed_at TEXT,
+        PRIMARY KEY (city, date, queue)
+    )
+    """)
+    cursor.execute("""
+    INSERT INTO history_daily (date, queue, changes, first_changed_at, last_changed_at)
+    SELECT date, queue, changes, first_changed_at, last_changed_at FROM history_daily_old
+    """)
+    cursor.execute("DROP TABLE history_daily_old")
+
+def _migrate_outages_to_slots(cursor):
+    """Додає стовпець slots до старих баз і переводить графіки в маски"""
+    _add_column(cursor, "outages", "slots", "BLOB")
+    
+    rows = cursor.execute("""
+    SELECT id, time_ranges FROM outages WHERE slots IS NULL AND time_ranges IS NOT NULL
+    """).fetchall()
+    
+    updates = []
+    for row_id, time_ranges_json in rows:
+        time_ranges_json, slots = _encode_schedule(json.loads(time_ranges_json))
+        if slots is not None:
+            updates.append((time_ranges_json, slots, row_id))
+    
+    cursor.executemany("UPDATE outages SET time_ranges = ?, slots = ? WHERE id = ?", updates)
+
+def _encode_schedule(time_ranges):
+    """Графік -> (JSON або None, маска-BLOB або None) для запису в outages
+    
+    Якщо маска точно відтворює список проміжків, JSON не зберігається.
+    """
+    mask = ranges_to_mask(time_ranges)
+    
+    if mask is None:
+        return json.dumps(time_ranges, ensure_ascii=False), None
+    
+    if mask_to_ranges(mask) == list(time_ranges):
+        return None, mask_to_blob(mask)
+    
+    return json.dumps(time_ranges, ensure_ascii=False), mask_to_blob(mask)
+
+def _decode_schedule(time_ranges_json, slots):
+    """(JSON, маска-BLOB) з outages -> список проміжків"""
+    if time_ranges_json is None:
+        return mask_to_ranges(blob_to_mask(slots))
+    return json.loads(time_ranges_json)
+
+def _history_delta(old_ranges, new_ranges):
+    """(old_schedule, new_schedule, added, removed) для запису в history
+    
+    Якщо обидва графіки кодуються масками, зберігається лише різниця.
+    """
+    old_mask = ranges_to_mask(old_ranges)
+    new_mask = ranges_to_mask(new_ranges)
+    
+    if old_mask is None or new_mask is None:
+        return (
+            json.dumps(old_ranges, ensure_ascii=False),
+            json.dumps(new_ranges, ensure_ascii=False),
+            None,
+            None
+        )
+    
+    added, removed = diff_masks(old_mask, new_mask)
+    return (
+        None,
+        None,
+        json.dumps(mask_to_ranges(added)),
+        json.dumps(mask_to_ranges(removed))
+    )
+
+def _same_schedule(old, new):
+    """Порівнює два закодовані графіки: за масками, якщо вони є в обох"""
+    if old[1] is not None and new[1] is not None:
+        return old[1] == new[1]
+    return old[0] == new[0]
+
+def save_user(chat_id, city=CITY, queue=None, notify=1):
+    """Зберігає або оновлює дані користувача"""
+    conn = get_connection()
+    with DB_WRITE_SECONDS.time("save_user"), conn:
+        conn.execute("""
+        INSERT OR REPLACE INTO users (chat_id, city, queue, notify)
+        VALUES (?, ?, ?, ?)
+        """, (chat_id, city, queue, notify))
+        if queue is not None:
+            conn.execute("""
+            INSERT OR IGNORE INTO subscriptions (chat_id, city, queue) VALUES (?, ?, ?)
+            """, (chat_id, city, queue))
+    forget_user(chat_id)
+    put_user(chat_id, (chat_id, city, queue, notify))
 
 def get_user(chat_id):
     """Отримує дані користувача"""
-    cursor.execute("SELECT * FROM users WHERE chat_id = ?", (chat_id,))
-    return cursor.fetchone()
+    found, user = get_cached_user(chat_id)
+    if found:
+        CACHE_REQUESTS.inc("user", "hit")
+        return user
+    
+    CACHE_REQUESTS.inc("user", "miss")
+    
+    # CAST: у старих базах стовпець queue має тип INTEGER і черги зберігались як числа
+    with DB_READ_SECONDS.time("get_user"):
+        cursor = get_connection().execute("""
+        SELECT chat_id, city, CAST(queue AS TEXT), notify FROM users WHERE chat_id = ?
+        """, (chat_id,))
+        user = cursor.fetchone()
+    put_user(chat_id, user)
+    return user
 
 def update_user_queue(chat_id, queue):
-    """Оновлює чергу користувача"""
-    cursor.execute("UPDATE users SET queue = ? WHERE chat_id = ?", (queue, chat_id))
-    conn.commit()
+    """Оновлює чергу користувача: вона замінює всі його підписки"""
+    conn = get_connection()
+    with DB_WRITE_SECONDS.time("update_user"), conn:
+        # Вибір черги - знак, що користувач знову чекає сповіщень (навіть якщо блокував бота)
+        conn.execute("UPDATE users SET queue = ?, notify = 1 WHERE chat_id = ?", (queue, chat_id))
+        conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        conn.execute("""
+        INSERT INTO subscriptions (chat_id, city, queue)
+        SELECT chat_id, city, ? FROM users WHERE chat_id = ?
+        """, (queue, chat_id))
+    forget_user(chat_id)
+
+def get_subscriptions(chat_id):
+    """Черги, на які підписаний користувач: [(місто, черга)]"""
+    subscriptions = get_cached_subscriptions(chat_id)
+    if subscriptions is not None:
+        CACHE_REQUESTS.inc("subscriptions", "hit")
+        return subscriptions
+    
+    CACHE_REQUESTS.inc("subscriptions", "miss")
+    
+    with DB_READ_SECONDS.time("get_subscriptions"):
+        cursor = get_connection().execute("""
+        SELECT city, queue FROM subscriptions WHERE chat_id = ? ORDER BY city, queue
+        """, (chat_id,))
+        subscriptions = cursor.fetchall()
+    put_subscriptions(chat_id, subscriptions)
+    return subscriptions
+
+def add_subscription(chat_id, city, queue):
+    """Додає чергу до підписок; False, якщо вона вже є"""
+    conn = get_connection()
+    with DB_WRITE_SECONDS.time("update_subscriptions"), conn:
+        cursor = conn.execute("""
+        INSERT OR IGNORE INTO subscriptions (chat_id, city, queue) VALUES (?, ?, ?)
+        """, (chat_id, city, queue))
+        added = cursor.rowcount > 0
+        # Перша черга стає основною
+        conn.execute("""
+        UPDATE users SET queue = ? WHERE chat_id = ? AND city = ? AND queue IS NULL
+        """, (queue, chat_id, city))
+        conn.execute("UPDATE users SET notify = 1 WHERE chat_id = ?", (chat_id,))
+    forget_user(chat_id)
+    return added
+
+def remove_subscription(chat_id, city, queue):
+    """Видаляє чергу з підписок; False, якщо її не було"""
+    conn = get_connection()
+    with DB_WRITE_SECONDS.time("update_subscriptions"), conn:
+        cursor = conn.execute("""
+        DELETE FROM subscriptions WHERE chat_id = ? AND city = ? AND queue = ?
+        """, (chat_id, city, queue))
+        removed = cursor.rowcount > 0
+        conn.execute("UPDATE users SET notify = 1 WHERE chat_id = ?", (chat_id,))
+        # Основною стає інша черга того ж міста (або жодна)
+        conn.execute("""
+        UPDATE users SET queue = (
+            SELECT MIN(queue) FROM subscriptions
+            WHERE subscriptions.chat_id = users.chat_id AND subscriptions.city = users.city
+        )
+        WHERE chat_id = ? AND city = ? AND CAST(queue AS TEXT) = ?
+        """, (chat_id, city, queue))
+    forget_user(chat_id)
+    return removed
+
+def update_user_city(chat_id, city):
+    """Змінює місто користувача (черги і підписки скидаються: у кожного міста свої черги)"""
+    conn = get_connection()
+    with DB_WRITE_SECONDS.time("update_user"), conn:
+        conn.execute("UPDATE users SET city = ?, queue = NULL WHERE chat_id = ?", (city, chat_id))
+        conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+    forget_user(chat_id)
 
 def update_user_notify(chat_id, notify):
     """Увімкнути/вимкнути сповіщення"""
-    cursor.execute("UPDATE users SET notify = ? WHERE chat_id = ?", (notify, chat_id))
-    conn.commit()
+    conn = get_connection()
+    with DB_WRITE_SECONDS.time("update_user"):
+        conn.execute("UPDATE users SET notify = ? WHERE chat_id = ?", (notify, chat_id))
+        conn.commit()
+    forget_user(chat_id)
 
-def save_schedule(date, queue, time_ranges):
+def save_schedule(date, queue, time_ranges, city=CITY):
     """Зберігає графік відключень"""
-    time_ranges_json = json.dumps(time_ranges, ensure_ascii=False)
+    save_schedules_bulk({date: {queue: time_ranges}}, city)
+
+def save_schedules_bulk(schedules, city=CITY):
+    """Зберігає всі графіки міста {дата: {черга: [проміжки]}} однією транзакцією
+    
+    Записує лише змінені рядки та історію до них. Повертає список
+    (дата, черга, старий графік) для вже збережених графіків, що змінились.
+    """
+    if not schedules:
+        return []
+    
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
     
-    cursor.execute("""
-    SELECT time_ranges FROM outages 
-    WHERE date = ? AND queue = ?
-    """, (date, queue))
+    dates = list(schedules)
+    placeholders = ", ".join("?" * len(dates))
+    with DB_READ_SECONDS.time("stored_schedules"):
+        cursor = conn.execute(f"""
+        SELECT date, CAST(queue AS TEXT), time_ranges, slots FROM outages
+        WHERE city = ? AND date IN ({placeholders})
+        """, [city, *dates])
+        stored = {(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()}
     
-    old = cursor.fetchone()
+    upserts = []
+    cached = []
+    history = []
+    changed = []
+    outbox = []
     
-    if old:
-        if old[0] != time_ranges_json:
-            cursor.execute("""
-            INSERT INTO history (date, queue, old_schedule, new_schedule, changed_at)
-            VALUES (?, ?, ?, ?, ?)
-            """, (date, queue, old[0], time_ranges_json, now))
+    for date, queues_data in schedules.items():
+        for queue, time_ranges in queues_data.items():
+            new = _encode_schedule(time_ranges)
+            old = stored.get((date, queue))
             
-            cursor.execute("""
-            UPDATE outages 
-            SET time_ranges = ?, last_updated = ?
-            WHERE date = ? AND queue = ?
-            """, (time_ranges_json, now, date, queue))
-            print(f"📝 Оновлено графік для черги {queue} на {date}")
-    else:
-        cursor.execute("""
-        INSERT INTO outages (date, queue, time_ranges, last_updated)
-        VALUES (?, ?, ?, ?)
-        """, (date, queue, time_ranges_json, now))
-        print(f"➕ Додано новий графік для черги {queue} на {date}")
+            if old is not None and _same_schedule(old, new):
+                continue
+            
+            upserts.append((city, date, queue, new[0], new[1], now))
+            cached.append((city, date, queue, time_ranges))
+            
+            if old is not None:
+                old_ranges = _decode_schedule(*old)
+                delta = _history_delta(old_ranges, time_ranges)
+                history.append((city, date, queue, *delta, now))
+                changed.append((date, queue, old_ranges))
+                outbox.append((
+                    city,
+                    date,
+                    queue,
+                    json.dumps(old_ranges, ensure_ascii=False),
+                    json.dumps(time_ranges, ensure_ascii=False),
+                    now
+                ))
     
-    conn.commit()
+    if not upserts:
+        return []
+    
+    with DB_WRITE_SECONDS.time("save_schedules"), conn:
+        conn.executemany("""
+        INSERT INTO outages (city, date, queue, time_ranges, slots, last_updated)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (city, date, queue) DO UPDATE SET
+            time_ranges = excluded.time_ranges,
+            slots = excluded.slots,
+            last_updated = excluded.last_updated
+        """, upserts)
+        
+        conn.executemany("""
+        INSERT INTO history (city, date, queue, old_schedule, new_schedule, added, removed, changed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, history)
+        
+        # Сповіщення не загубиться: зміна і запис про неї фіксуються разом
+        conn.executemany("""
+        INSERT INTO outbox (city, date, queue, old_schedule, new_schedule, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, outbox)
+    
+    # Кеш оновлюється лише після успішної транзакції
+    put_schedules(cached)
+    
+    print(f"💾 {city}: збережено {len(upserts)} графіків, змінено {len(changed)}")
+    return changed
 
-def get_schedule(date, queue):
-    """Отримує графік на певну дату для певної черги"""
-    cursor.execute("""
-    SELECT time_ranges FROM outages 
-    WHERE date = ? AND queue = ?
-    """, (date, queue))
+def get_schedule(date, queue, city=CITY):
+    """Отримує графік на певну дату для певної черги міста"""
+    found, schedule = get_cached_schedule(city, date, queue)
+    if found:
+        CACHE_REQUESTS.inc("schedule", "hit")
+        return schedule
     
-    result = cursor.fetchone()
-    if result:
-        return json.loads(result[0])
-    return None
+    CACHE_REQUESTS.inc("schedule", "miss")
+    
+    with DB_READ_SECONDS.time("get_schedule"):
+        cursor = get_connection().execute("""
+        SELECT time_ranges, slots FROM outages 
+        WHERE city = ? AND date = ? AND queue = ?
+        """, (city, date, queue))
+        result = cursor.fetchone()
+    
+    schedule = _decode_schedule(*result) if result else None
+    put_schedules([(city, date, queue, schedule)])
+    return schedule
 
-def get_all_users_by_queue(queue):
-    """Отримує всіх користувачів певної черги"""
-    cursor.execute("""
-    SELECT chat_id FROM users 
-    WHERE queue = ? AND notify = 1
-    """, (queue,))
-    return [row[0] for row in cursor.fetchall()]
+def warm_caches(dates, city_queues):
+    """Завантажує в кеш графіки на дати, користувачів і їхні підписки одним читанням
+    
+    city_queues - усі (місто, черга); графіки, яких немає в БД, кешуються як None.
+    Повертає (кількість графіків, кількість користувачів).
+    """
+    conn = get_connection()
+    placeholders = ", ".join("?" * len(dates))
+    
+    # Одна транзакція - узгоджений знімок усіх трьох таблиць
+    with DB_READ_SECONDS.time("warm_caches"):
+        conn.execute("BEGIN")
+        try:
+            outages = conn.execute(f"""
+            SELECT city, date, CAST(queue AS TEXT), time_ranges, slots FROM outages
+            WHERE date IN ({placeholders})
+            """, list(dates)).fetchall()
+            users = conn.execute("""
+            SELECT chat_id, city, CAST(queue AS TEXT), notify FROM users
+            """).fetchall()
+            subscriptions = conn.execute("""
+            SELECT chat_id, city, queue FROM subscriptions ORDER BY chat_id, city, queue
+            """).fetchall()
+        finally:
+            conn.commit()
+    
+    schedules = {(city, date, queue): None for date in dates for city, queue in city_queues}
+    for city, date, queue, time_ranges, slots in outages:
+        schedules[(city, date, queue)] = _decode_schedule(time_ranges, slots)
+    put_schedules([(*key, time_ranges) for key, time_ranges in schedules.items()])
+    
+    by_chat = {}
+    for chat_id, city, queue in subscriptions:
+        by_chat.setdefault(chat_id, []).append((city, queue))
+    
+    for user in users:
+        put_user(user[0], user)
+        put_subscriptions(user[0], by_chat.get(user[0], []))
+    
+    return len(outages), len(users)
+
+def get_all_users_by_queue(queue, city=CITY):
+    """Отримує всіх користувачів, підписаних на певну чергу міста"""
+    with DB_READ_SECONDS.time("users_by_queue"):
+        cursor = get_connection().execute("""
+        SELECT subscriptions.chat_id FROM subscriptions
+        JOIN users ON users.chat_id = subscriptions.chat_id AND users.notify = 1
+        WHERE subscriptions.city = ? AND subscriptions.queue = ?
+        """, (city, str(queue)))
+        return [row[0] for row in cursor.fetchall()]
+
+def iter_subscribers(targets, chunk_size=FANOUT_CHUNK_SIZE, after_chat_id=None):
+    """Підписники кількох (місто, черга) одним запитом, порціями по chunk_size чатів
+    
+    after_chat_id - продовжити обхід після цього чату.
+    
+    Кожна порція - список (chat_id, [(місто, черга), ...]); рядки одного чату
+    не розриваються між порціями. subscriptions читається в порядку первинного
+    ключа (chat_id, місто, черга), без сортування, тож перша порція готова
+    одразу, а не після читання всіх підписників. Запит іде окремим
+    з'єднанням, тож записи в БД між порціями не впливають на обхід.
+    """
+    targets = list(targets)
+    if not targets:
+        return
+    
+    values = ", ".join(["(?, ?)"] * len(targets))
+    params = [value for city, queue in targets for value in (city, str(queue))]
+    conn = _connect()
+    
+    try:
+        # "+" вимикає індекс (city, queue) для цього фільтра: інакше SQLite може
+        # обрати його і сортувати весь результат перед першим рядком
+        cursor = conn.execute(f"""
+        SELECT subscriptions.chat_id, subscriptions.city, subscriptions.queue
+        FROM subscriptions
+        JOIN users ON users.chat_id = subscriptions.chat_id AND users.notify = 1
+        WHERE subscriptions.chat_id > ?
+        AND (+subscriptions.city, +subscriptions.queue) IN (VALUES {values})
+        ORDER BY subscriptions.chat_id, subscriptions.city, subscriptions.queue
+        """, [after_chat_id if after_chat_id is not None else -2 ** 63, *params])
+        
+        chunk = []
+        chat_id, subscriptions = None, []
+        
+        while True:
+            # Уся робота запиту відбувається тут, порція за порцією
+            with DB_READ_SECONDS.time("subscribers"):
+                rows = cursor.fetchmany(chunk_size)
+            
+            for row_chat_id, city, queue in rows:
+                if row_chat_id != chat_id:
+                    if subscriptions:
+                        chunk.append((chat_id, subscriptions))
+                    chat_id, subscriptions = row_chat_id, []
+                subscriptions.append((city, queue))
+            
+            if not rows:
+                if subscriptions:
+                    chunk.append((chat_id, subscriptions))
+                if chunk:
+                    yield chunk
+                return
+            
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    finally:
+        conn.close()
+
+def get_pending_changes():
+    """Зміни з outbox: [(id, місто, дата, черга, старий графік, новий графік, час)]"""
+    cursor = get_connection().execute("""
+    SELECT id, city, date, CAST(queue AS TEXT), old_schedule, new_schedule, created_at
+    FROM outbox ORDER BY id
+    """)
+    return [
+        (row[0], row[1], row[2], row[3], json.loads(row[4]), json.loads(row[5]), row[6])
+        for row in cursor.fetchall()
+    ]
+
+def get_outbox_progress():
+    """(остання зміна, останній chat_id) незавершеного перетворення змін або None"""
+    return get_connection().execute("""
+    SELECT last_change_id, last_chat_id FROM outbox_progress WHERE id = 1
+    """).fetchone()
+
+def enqueue_deliveries(deliveries, last_change_id, last_chat_id):
+    """Записує повідомлення [(chat_id, текст, мітка)] разом з позицією, докуди дійшли"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    
+    with DB_WRITE_SECONDS.time("enqueue_deliveries"), conn:
+        conn.executemany("""
+        INSERT INTO outbox_deliveries (chat_id, text, label, created_at) VALUES (?, ?, ?, ?)
+        """, [(chat_id, text, label, now) for chat_id, text, label in deliveries])
+        conn.execute("""
+        INSERT OR REPLACE INTO outbox_progress (id, last_change_id, last_chat_id) VALUES (1, ?, ?)
+        """, (last_change_id, last_chat_id))
+
+def finish_changes(last_change_id):
+    """Прибирає з outbox зміни, для яких уже записано всі повідомлення"""
+    conn = get_connection()
+    
+    with DB_WRITE_SECONDS.time("finish_changes"), conn:
+        conn.execute("DELETE FROM outbox WHERE id <= ?", (last_change_id,))
+        conn.execute("DELETE FROM outbox_progress")
+
+def get_deliveries(after_id, limit):
+    """Наступна порція повідомлень: [(id, chat_id, текст, мітка)]"""
+    cursor = get_connection().execute("""
+    SELECT id, chat_id, text, label FROM outbox_deliveries
+    WHERE id > ? ORDER BY id LIMIT ?
+    """, (after_id, limit))
+    return cursor.fetchall()
+
+def finish_deliveries(delivery_ids, dead_chat_ids):
+    """Видаляє відправлені повідомлення і вимикає сповіщення для недоступних чатів"""
+    conn = get_connection()
+    
+    with DB_WRITE_SECONDS.time("finish_deliveries"), conn:
+        conn.executemany("DELETE FROM outbox_deliveries WHERE id = ?", [(i,) for i in delivery_ids])
+        conn.executemany("UPDATE users SET notify = 0 WHERE chat_id = ?", [(c,) for c in dead_chat_ids])
+    
+    for chat_id in dead_chat_ids:
+        forget_user(chat_id)
 
 def get_recent_changes(limit=10):
     """Отримує останні зміни графіків"""
-    cursor.execute("""
+    cursor = get_connection().execute("""
     SELECT * FROM history 
     ORDER BY changed_at DESC 
     LIMIT ?
     """, (limit,))
-    return cursor.fetchall()
\ No newline at end of file
+    return cursor.fetchall()
+
+def compact_history(retention_days, batch_size=500):
+    """Стискає історію: повні знімки -> різниці, старі записи -> підсумки за день"""
+    conn = get_connection()
+    
+    # Старі записи з повними знімками переводимо в різниці
+    converted = 0
+    while True:
+        rows = conn.execute("""
+        SELECT id, old_schedule, new_schedule FROM history
+        WHERE old_schedule IS NOT NULL AND added IS NULL AND id > ?
+        ORDER BY id
+        LIMIT ?
+        """, (converted, batch_size)).fetchall()
+        
+        if not rows:
+            break
+        
+        updates = []
+        for row_id, old_json, new_json in rows:
+            delta = _history_delta(json.loads(old_json), json.loads(new_json))
+            if delta[2] is not None:
+                updates.append((*delta, row_id))
+        
+        with conn:
+            conn.executemany("""
+            UPDATE history SET old_schedule = ?, new_schedule = ?, added = ?, removed = ?
+            WHERE id = ?
+            """, updates)
+        
+        converted = rows[-1][0]
+    
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+    
+    with conn:
+        conn.execute("""
+        INSERT INTO history_daily (city, date, queue, changes, first_changed_at, last_changed_at)
+        SELECT city, date, CAST(queue AS TEXT), COUNT(*), MIN(changed_at), MAX(changed_at)
+        FROM history
+        WHERE changed_at < ?
+        GROUP BY city, date, queue
+        ON CONFLICT (city, date, queue) DO UPDATE SET
+            changes = changes + excluded.changes,
+            first_changed_at = MIN(first_changed_at, excluded.first_changed_at),
+            last_changed_at = MAX(last_changed_at, excluded.last_changed_at)
+        """, (cutoff,))
+        
+        removed = conn.execute("DELETE FROM history WHERE changed_at < ?", (cutoff,)).rowcount
+    
+    conn.execute("PRAGMA optimize")
+    print(f"🗜️ Історія: видалено {removed} записів старших за {retention_days} дн.")
+    return removed
+
+def get_page_validators():
+    """Отримує збережені ETag/Last-Modified і хеші сторінок"""
+    cursor = get_connection().execute("""
+    SELECT url, date, etag, last_modified, content_hash FROM page_cache
+    """)
+    return {
+        row[0]: {
+            "date": row[1],
+            "etag": row[2],
+            "last_modified": row[3],
+            "content_hash": row[4]
+        }
+        for row in cursor.fetchall()
+    }
+
+def save_page_validators(url, date, etag, last_modified, content_hash):
+    """Зберігає валідатори сторінки для умовних запитів"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_connection()
+    conn.execute("""
+    INSERT OR REPLACE INTO page_cache (url, date, etag, last_modified, content_hash, checked_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, (url, date, etag, last_modified, content_hash, now))
+    conn.commit()
\ No newline at end of file
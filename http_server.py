@@ -0,0 +1,138 @@
+# http_server.py - Мінімальний HTTP/1.1 сервер на asyncio (метрики, вебхук)
+
+import asyncio
+
+MAX_BODY_BYTES = 1024 * 1024
+# Заголовки читаються до перевірки секрету вебхука - їхній обсяг обмежений
+MAX_HEADERS = 100
+MAX_HEADER_BYTES = 16 * 1024
+# Скільки чекати наступного запиту на відкритому з'єднанні, с
+KEEPALIVE_TIMEOUT = 60
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error"
+}
+
+class HeadersTooLarge(ValueError):
+    """Забагато заголовків або вони завеликі"""
+
+class Request:
+    """Один HTTP-запит"""
+    
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        # Назви заголовків у нижньому регістрі
+        self.headers = headers
+        self.body = body
+
+async def _read_request(reader):
+    """Читає запит з з'єднання; None, якщо клієнт закрив з'єднання"""
+    request_line = await asyncio.wait_for(reader.readline(), timeout=KEEPALIVE_TIMEOUT)
+    if not request_line.strip():
+        return None
+    
+    parts = request_line.decode("latin-1").split()
+    if len(parts) < 2:
+        raise ValueError("Некоректний рядок запиту")
+    
+    headers = {}
+    count = 0
+    size = 0
+    while True:
+        line = await asyncio.wait_for(reader.readline(), timeout=10)
+        if not line.strip():
+            break
+        
+        count += 1
+        size += len(line)
+        if count > MAX_HEADERS or size > MAX_HEADER_BYTES:
+            raise HeadersTooLarge(f"{count} заголовків, {size} байт")
+        
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY_BYTES:
+        raise OverflowError(length)
+    
+    body = await asyncio.wait_for(reader.readexactly(length), timeout=10) if length else b""
+    return Request(parts[0].upper(), parts[1].split("?")[0], headers, body)
+
+def _response(status, body, content_type, keep_alive):
+    return (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    ).encode("latin-1") + body
+
+class HttpServer:
+    """Сервер з keep-alive; handler(request) -> (статус, тіло bytes, Content-Type)"""
+    
+    def __init__(self, handler):
+        self.handler = handler
+        self.server = None
+        # Відкриті з'єднання: закриваються під час зупинки, щоб не чекати keep-alive
+        self.connections = set()
+    
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._serve_connection, host, port)
+    
+    async def stop(self):
+        if self.server is None:
+            return
+        
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+        self.server = None
+    
+    async def _serve_connection(self, reader, writer):
+        self.connections.add(writer)
+        
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except OverflowError:
+                    writer.write(_response(413, b"too large\n", "text/plain", False))
+                    break
+                except HeadersTooLarge:
+                    writer.write(_response(431, b"headers too large\n", "text/plain", False))
+                    break
+                except ValueError:
+                    writer.write(_response(400, b"bad request\n", "text/plain", False))
+                    break
+                
+                if request is None:
+                    break
+                
+                try:
+                    status, body, content_type = await self.handler(request)
+                except Exception as e:
+                    print(f"❌ Помилка HTTP-обробника {request.path}: {e}")
+                    status, body, content_type = 500, b"error\n", "text/plain"
+                
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                writer.write(_response(status, body, content_type, keep_alive))
+                await writer.drain()
+                
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            # Зупинка циклу подій з відкритим keep-alive з'єднанням
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
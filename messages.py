@@ -0,0 +1,100 @@
+# messages.py - Готові тексти повідомлень з графіками
+
+from datetime import datetime
+
+from cache import get_schedule_version
+from database import get_schedule
+from metrics import CACHE_REQUESTS
+from slots import ranges_to_mask, mask_to_ranges, diff_masks
+
+# (місто, дата, черга, вид) -> (версія графіка, текст)
+_rendered = {}
+
+def format_schedule(time_ranges):
+    """Форматує список часових проміжків"""
+    if not time_ranges:
+        return "✅ Відключень немає"
+    
+    return "\n".join([f"⚡️ {time_range}" for time_range in time_ranges])
+
+def render_message(date, queue, kind, time_ranges):
+    """Будує HTML-текст повідомлення
+
+    kind: "today" / "tomorrow" - перегляд графіка
+    """
+    day_name = "сьогодні" if kind == "today" else "завтра"
+    date_readable = datetime.strptime(date, "%Y-%m-%d").strftime("%d.%m.%Y")
+    
+    if time_ranges is None:
+        return f"""
+📅 <b>Графік на {day_name} ({date_readable})</b>
+🔢 Черга: {queue}
+
+⚠️ Дані ще не завантажені. Натисніть '🔄 Оновити графік'
+"""
+    
+    return f"""
+📅 <b>Графік на {day_name} ({date_readable})</b>
+🔢 Черга: {queue}
+
+{format_schedule(time_ranges)}
+"""
+
+def format_change(old_ranges, new_ranges):
+    """Лише додані і скасовані проміжки (або весь новий графік, якщо маски немає)"""
+    old_mask = ranges_to_mask(old_ranges or [])
+    new_mask = ranges_to_mask(new_ranges)
+    
+    if old_ranges is None or old_mask is None or new_mask is None:
+        return f"<b>Новий графік:</b>\n{format_schedule(new_ranges)}"
+    
+    added, removed = diff_masks(old_mask, new_mask)
+    lines = [f"🔴 Додано: {time_range}" for time_range in mask_to_ranges(added)]
+    lines += [f"🟢 Скасовано: {time_range}" for time_range in mask_to_ranges(removed)]
+    return "\n".join(lines)
+
+def render_changes(queue_changes):
+    """Одне сповіщення про зміни кількох черг: [(черга, [(дата, старий графік, новий графік)])]"""
+    sections = []
+    
+    for queue, changes in queue_changes:
+        sections.append(f"🔢 Черга: {queue}")
+        
+        for date, old_ranges, new_ranges in changes:
+            date_readable = datetime.strptime(date, "%Y-%m-%d").strftime("%d.%m.%Y")
+            sections.append(f"📅 <b>{date_readable}</b>\n{format_change(old_ranges, new_ranges)}")
+    
+    sections_text = "\n\n".join(sections)
+    return f"""
+🔔 <b>ЗМІНА ГРАФІКУ!</b>
+
+{sections_text}
+"""
+
+def get_message(city, date, queue, kind):
+    """Повертає готовий текст, перебудовує його лише після зміни графіка"""
+    version = get_schedule_version(city, date, queue)
+    entry = _rendered.get((city, date, queue, kind))
+    
+    if entry is not None and version and entry[0] == version:
+        CACHE_REQUESTS.inc("message", "hit")
+        return entry[1]
+    
+    CACHE_REQUESTS.inc("message", "miss")
+    
+    time_ranges = get_schedule(date, queue, city)
+    # get_schedule міг щойно завантажити графік у кеш
+    version = get_schedule_version(city, date, queue)
+    text = render_message(date, queue, kind, time_ranges)
+    _rendered[(city, date, queue, kind)] = (version, text)
+    return text
+
+def prerender(city, date, queue, kinds):
+    """Будує тексти заздалегідь (під час збереження нових графіків)"""
+    for kind in kinds:
+        get_message(city, date, queue, kind)
+
+def evict_messages_before(date):
+    """Видаляє тексти для дат, раніших за вказану"""
+    for key in [key for key in _rendered if key[1] < date]:
+        del _rendered[key]
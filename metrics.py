@@ -0,0 +1,213 @@
+# metrics.py - Лічильники і гістограми затримок для /stats і Prometheus
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from http_server import HttpServer
+
+# Межі кошиків гістограм, секунди
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Спільний замок: частина вимірювань надходить з потоків виконавця
+_lock = threading.Lock()
+# Усі метрики в порядку оголошення
+_registry = []
+
+_server = None
+
+class Counter:
+    """Лічильник, що лише зростає (окремо для кожного набору міток)"""
+    
+    kind = "counter"
+    
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.values = {}
+        _registry.append(self)
+    
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+class Histogram:
+    """Розподіл тривалостей за кошиками BUCKETS"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name, description, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        # мітки -> [кількість у кожному кошику (+ останній для > max), сума, кількість]
+        self.values = {}
+        _registry.append(self)
+    
+    def observe(self, seconds, *label_values):
+        index = bisect_left(self.buckets, seconds)
+        
+        with _lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+    
+    @contextmanager
+    def time(self, *label_values):
+        """with HISTOGRAM.time("мітка"): ... - вимірює тривалість блоку"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+    
+    def quantile(self, q, label_values):
+        """Оцінка квантиля: верхня межа кошика, в який він потрапляє"""
+        counts, _, count = self.values[label_values]
+        rank = q * count
+        seen = 0
+        
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        
+        return float("inf")
+
+class Gauge:
+    """Поточне значення, яке читається функцією в момент запиту"""
+    
+    kind = "gauge"
+    
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.labels = ()
+        self.read = None
+        _registry.append(self)
+    
+    def set_function(self, read):
+        self.read = read
+    
+    def value(self):
+        return self.read() if self.read else 0
+
+# Завантаження сторінок і розбір
+FETCH_SECONDS = Histogram("bot_fetch_seconds", "Час HTTP-запиту сторінки", ("url",))
+FETCH_ERRORS = Counter("bot_fetch_errors_total", "Помилки завантаження сторінок", ("url",))
+PARSE_SECONDS = Histogram("bot_parse_seconds", "Час розбору сторінки", ("city",))
+CHECK_SECONDS = Histogram("bot_check_seconds", "Тривалість повної перевірки оновлень")
+
+# База даних і кеш
+DB_READ_SECONDS = Histogram("bot_db_read_seconds", "Час читання з БД", ("query",))
+DB_WRITE_SECONDS = Histogram("bot_db_write_seconds", "Час запису в БД", ("query",))
+CACHE_REQUESTS = Counter("bot_cache_requests_total", "Звернення до кешів", ("cache", "result"))
+
+# Обробники Telegram
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Час обробки команди", ("command",))
+UPDATE_WAIT_SECONDS = Histogram("bot_update_wait_seconds", "Очікування оновлення на свою чергу і вільний воркер")
+
+# Розсилка
+QUEUE_DEPTH = Gauge("bot_broadcast_queue_depth", "Повідомлень у черзі розсилки")
+SEND_SECONDS = Histogram("bot_send_seconds", "Час відправки одного повідомлення")
+MESSAGES_SENT = Counter("bot_messages_sent_total", "Доставлені повідомлення")
+SEND_ERRORS = Counter("bot_send_errors_total", "Помилки відправки", ("error",))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def render_prometheus():
+    """Усі метрики в текстовому форматі Prometheus"""
+    lines = []
+    
+    with _lock:
+        for metric in _registry:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            
+            if metric.kind == "gauge":
+                lines.append(f"{metric.name} {metric.value()}")
+                continue
+            
+            for label_values, value in sorted(metric.values.items()):
+                if metric.kind == "counter":
+                    lines.append(f"{metric.name}{_format_labels(metric.labels, label_values)} {value}")
+                    continue
+                
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip((*metric.buckets, "+Inf"), counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(metric.labels, label_values, f'le="{bound}"')
+                    lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                
+                labels = _format_labels(metric.labels, label_values)
+                lines.append(f"{metric.name}_sum{labels} {total}")
+                lines.append(f"{metric.name}_count{labels} {count}")
+    
+    return "\n".join(lines) + "\n"
+
+def render_summary():
+    """Короткий текстовий звіт для /stats"""
+    lines = []
+    
+    with _lock:
+        for metric in _registry:
+            if metric.kind == "gauge":
+                lines.append(f"{metric.name}: {metric.value()}")
+                continue
+            
+            for label_values, value in sorted(metric.values.items()):
+                name = metric.name + (f"[{', '.join(map(str, label_values))}]" if label_values else "")
+                
+                if metric.kind == "counter":
+                    lines.append(f"{name}: {value}")
+                    continue
+                
+                _, total, count = value
+                p50 = metric.quantile(0.5, label_values) * 1000
+                p99 = metric.quantile(0.99, label_values) * 1000
+                lines.append(
+                    f"{name}: n={count} сер={total / count * 1000:.2f}мс "
+                    f"p50≤{p50:g}мс p99≤{p99:g}мс"
+                )
+    
+    schedule_hits = CACHE_REQUESTS.values.get(("schedule", "hit"), 0)
+    schedule_misses = CACHE_REQUESTS.values.get(("schedule", "miss"), 0)
+    if schedule_hits + schedule_misses:
+        lines.append(f"влучання в кеш графіків: {schedule_hits / (schedule_hits + schedule_misses):.1%}")
+    
+    return "\n".join(lines) or "Даних ще немає"
+
+async def _handle_http(request):
+    if request.method == "GET" and request.path == "/metrics":
+        return 200, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    return 404, b"not found\n", "text/plain"
+
+async def start_metrics_server(host, port):
+    """Запускає HTTP-ендпоінт /metrics для Prometheus"""
+    global _server
+    _server = HttpServer(_handle_http)
+    await _server.start(host, port)
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+
+async def stop_metrics_server():
+    """Зупиняє HTTP-ендпоінт метрик"""
+    global _server
+    
+    if _server is not None:
+        await _server.stop()
+        _server = None
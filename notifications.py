@@ -0,0 +1,160 @@
+# notifications.py - Збирання змін графіків з outbox у вікні і одне сповіщення на чергу
+
+import asyncio
+from datetime import datetime
+
+from config import NOTIFY_DEBOUNCE_SECONDS
+from database import (
+    iter_subscribers,
+    get_pending_changes,
+    get_outbox_progress,
+    enqueue_deliveries,
+    finish_changes
+)
+from messages import render_changes
+from outbox import wake_outbox
+from slots import ranges_to_mask
+
+_flush_handle = None
+_flush_task = None
+
+def schedule_flush(delay=NOTIFY_DEBOUNCE_SECONDS):
+    """Запускає вікно збирання змін; сповіщення піде після його закінчення"""
+    global _flush_handle
+    
+    # Вікно починається з першої зміни і не подовжується наступними
+    if _flush_handle is None:
+        _flush_handle = asyncio.get_running_loop().call_later(delay, _start_flush)
+
+def _schedule_pending(changes):
+    """Вікно для змін, що вже лежать в outbox (відлік - від найстарішої)"""
+    created_at = datetime.strptime(changes[0][6], "%Y-%m-%d %H:%M:%S")
+    elapsed = (datetime.now() - created_at).total_seconds()
+    schedule_flush(max(0, NOTIFY_DEBOUNCE_SECONDS - elapsed))
+
+def start_notifications():
+    """Після перезапуску дообробляє зміни, що лишились в outbox"""
+    changes = get_pending_changes()
+    if not changes:
+        return
+    
+    print(f"📬 В outbox {len(changes)} змін без сповіщень")
+    _schedule_pending(changes)
+
+def _same(old_ranges, new_ranges):
+    old_mask = ranges_to_mask(old_ranges)
+    new_mask = ranges_to_mask(new_ranges)
+    
+    if old_mask is not None and new_mask is not None:
+        return old_mask == new_mask
+    return list(old_ranges) == list(new_ranges)
+
+def _start_flush():
+    global _flush_handle, _flush_task
+    _flush_handle = None
+    
+    # Попереднє перетворення ще триває - нове почнеться після нього
+    if _flush_task is not None and not _flush_task.done():
+        schedule_flush()
+        return
+    
+    _flush_task = asyncio.get_running_loop().create_task(flush())
+
+async def flush():
+    """Перетворює зміни з outbox на повідомлення: одне на чергу, без змін, що повернулись назад"""
+    
+    try:
+        pending_changes = get_pending_changes()
+        progress = get_outbox_progress()
+    except Exception as e:
+        print(f"❌ Не вдалося прочитати outbox: {e}")
+        return
+    
+    # Незавершене перетворення продовжується з тим самим набором змін і з
+    # наступного чату; новіші зміни підуть окремим сповіщенням після нього
+    if progress is not None:
+        last_change_id, after_chat_id = progress
+        print(f"📬 Продовжую сповіщення після чату {after_chat_id}")
+    elif pending_changes:
+        last_change_id, after_chat_id = pending_changes[-1][0], None
+    else:
+        return
+    
+    newer_changes = [change for change in pending_changes if change[0] > last_change_id]
+    pending_changes = [change for change in pending_changes if change[0] <= last_change_id]
+    
+    # (місто, черга) -> {дата: [графік до першої зміни у вікні, останній графік]}
+    pending = {}
+    for _, city, date, queue, old_ranges, new_ranges, _ in pending_changes:
+        dates = pending.setdefault((city, queue), {})
+        if date in dates:
+            dates[date][1] = new_ranges
+        else:
+            dates[date] = [old_ranges, new_ranges]
+    
+    # (місто, черга) -> [(дата, старий графік, новий графік)]
+    changed_queues = {}
+    
+    for (city, queue), dates in pending.items():
+        changes = [
+            (date, old_ranges, new_ranges)
+            for date, (old_ranges, new_ranges) in sorted(dates.items())
+            if not _same(old_ranges, new_ranges)
+        ]
+        
+        if not changes:
+            print(f"↩️ {city}, черга {queue}: графік повернувся до попереднього, сповіщення не потрібне")
+            continue
+        
+        print(f"📢 {city}, черга {queue}: {len(changes)} змін")
+        changed_queues[(city, queue)] = changes
+    
+    # Набір змінених черг користувача -> (текст, мітка): хто підписаний
+    # на кілька черг, отримує про них одне спільне повідомлення
+    messages = {}
+    
+    def message_for(subscriptions):
+        key = tuple(subscriptions)
+        if key not in messages:
+            messages[key] = (
+                render_changes([(queue, changed_queues[(city, queue)]) for city, queue in key]),
+                "; ".join(f"{city}, черга {queue}" for city, queue in key)
+            )
+        return messages[key]
+    
+    # Підписники всіх змінених черг - одним запитом, порціями: розсилка
+    # починається з першої порції, не чекаючи, поки прочитаються всі.
+    # Кожна порція записується разом з останнім chat_id, тож після помилки
+    # чи перезапуску вже записані користувачі не отримають повтору.
+    recipients = 0
+    try:
+        for chunk in iter_subscribers(changed_queues, after_chat_id=after_chat_id):
+            deliveries = [(chat_id, *message_for(subscriptions)) for chat_id, subscriptions in chunk]
+            enqueue_deliveries(deliveries, last_change_id, chunk[-1][0])
+            recipients += len(chunk)
+            wake_outbox()
+            await asyncio.sleep(0)
+        
+        finish_changes(last_change_id)
+    except Exception as e:
+        print(f"❌ Не вдалося записати сповіщення в outbox: {e}")
+        schedule_flush()
+        return
+    
+    wake_outbox()
+    print(f"📢 Сповіщення поставлено в чергу для {recipients} користувачів")
+    
+    if newer_changes:
+        _schedule_pending(newer_changes)
+
+def cancel_pending():
+    """Скасовує відкладене надсилання (під час зупинки бота; зміни лишаються в outbox)"""
+    global _flush_handle, _flush_task
+    
+    if _flush_handle is not None:
+        _flush_handle.cancel()
+        _flush_handle = None
+    
+    if _flush_task is not None:
+        _flush_task.cancel()
+        _flush_task = None
@@ -0,0 +1,115 @@
+# outbox.py - Відправка повідомлень з outbox порціями, з продовженням після перезапуску
+
+import asyncio
+
+from telegram.error import BadRequest, Forbidden
+
+from broadcast import broadcast, pending_count
+from config import OUTBOX_BATCH_SIZE
+from database import get_deliveries, finish_deliveries
+
+# Як часто перевіряти outbox без сигналу і фіксувати відправлене, с
+IDLE_INTERVAL = 1.0
+
+_task = None
+_wakeup = None
+
+# Завершені відправки, ще не видалені з БД, і чати, що заблокували бота
+_finished = []
+_dead_chats = set()
+
+def _is_dead_chat(error):
+    """Чат більше не прийме повідомлень: бота заблоковано або чату не існує"""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+def _result_handler(delivery_ids):
+    """on_result для розсилки: chat_id -> id записів outbox"""
+    def on_result(chat_id, delivered, error):
+        _finished.append(delivery_ids[chat_id].pop())
+        if not delivered and _is_dead_chat(error):
+            _dead_chats.add(chat_id)
+    return on_result
+
+def _commit():
+    """Видаляє з outbox завершені відправки і вимикає сповіщення недоступним чатам"""
+    global _finished, _dead_chats
+    
+    if not _finished and not _dead_chats:
+        return
+    
+    finished, _finished = _finished, []
+    dead_chats, _dead_chats = _dead_chats, set()
+    
+    try:
+        finish_deliveries(finished, dead_chats)
+    except Exception as e:
+        print(f"❌ Не вдалося оновити outbox: {e}")
+        _finished.extend(finished)
+        _dead_chats.update(dead_chats)
+        return
+    
+    if dead_chats:
+        print(f"🔕 Сповіщення вимкнено для {len(dead_chats)} недоступних чатів")
+
+async def _drain():
+    # Курсор живе лише в пам'яті: після перезапуску все невидалене відправляється знову
+    cursor = 0
+    
+    while True:
+        # Не набираємо більше за одну порцію наперед: решта чекає в БД
+        while pending_count() >= OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(IDLE_INTERVAL)
+        
+        if len(_finished) >= OUTBOX_BATCH_SIZE:
+            _commit()
+        
+        try:
+            batch = get_deliveries(cursor, OUTBOX_BATCH_SIZE)
+        except Exception as e:
+            print(f"❌ Не вдалося прочитати outbox: {e}")
+            batch = []
+        
+        if not batch:
+            _commit()
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=IDLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        
+        # Однакові повідомлення йдуть однією розсилкою
+        groups = {}
+        for delivery_id, chat_id, text, label in batch:
+            delivery_ids = groups.setdefault((text, label), {})
+            delivery_ids.setdefault(chat_id, []).append(delivery_id)
+        
+        for (text, label), delivery_ids in groups.items():
+            chat_ids = [chat_id for chat_id, ids in delivery_ids.items() for _ in ids]
+            broadcast(chat_ids, text, label, on_result=_result_handler(delivery_ids))
+        
+        cursor = batch[-1][0]
+
+def wake_outbox():
+    """Сигнал, що в outbox з'явились нові повідомлення"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+def start_outbox():
+    """Запуск відправки з outbox (після start_broadcaster)"""
+    global _task, _wakeup
+    _wakeup = asyncio.Event()
+    _task = asyncio.get_running_loop().create_task(_drain())
+
+async def stop_outbox():
+    """Зупинка відправки; вже відправлене видаляється з outbox"""
+    global _task
+    
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+    
+    _commit()
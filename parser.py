@@ -1,133 +1,273 @@
 # parser.py - Парсер для bezsvitla.com.ua
 
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import hashlib
+import httpx
+import lxml.html
 from datetime import datetime, timedelta
 import re
+from urllib.parse import urlsplit
 
-ZHMERYNKA_URL = "https://bezsvitla.com.ua/vinnytska-oblast/zmerinka"
+from config import TIMEZONE, MAX_CONNECTIONS_PER_HOST
+from database import get_page_validators, save_page_validators
+from metrics import FETCH_SECONDS, FETCH_ERRORS, PARSE_SECONDS
 
-def fetch_outage_schedule():
-    """Отримує графік відключень для всіх підчерг"""
+QUEUE_PATTERN = re.compile(r'Черга\s+([\d\.]+)')
+TIME_RANGE_PATTERN = re.compile(r'(\d{2}:\d{2})\s*[–-]\s*(\d{2}:\d{2})')
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Спільний клієнт з пулом з'єднань, живе між циклами перевірки
+_http_client = None
+
+# ETag/Last-Modified і хеш тіла для кожної URL (копія таблиці page_cache)
+_page_validators = None
+# Валідатори нових версій сторінок, що ще не збережені в БД: місто -> {url: валідатори}
+# Потрапляють сюди лише разом з успішно розібраними графіками міста
+_pending_validators = {}
+
+# Обмеження одночасних запитів до одного сайту: хост -> семафор
+_host_limits = {}
+
+def get_http_client():
+    """Повертає спільний асинхронний HTTP-клієнт"""
+    global _http_client
     
-    try:
-        print(f"🔍 Завантажую дані з {ZHMERYNKA_URL}...")
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=httpx.Timeout(15.0, connect=5.0),
+            limits=httpx.Limits(max_connections=50, keepalive_expiry=900),
+            follow_redirects=True
+        )
+    
+    return _http_client
+
+async def close_http_client():
+    """Закриває спільний HTTP-клієнт"""
+    global _http_client
+    
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+def _get_validators(url, date):
+    """Повертає валідатори сторінки, якщо вони стосуються тієї ж дати"""
+    global _page_validators
+    
+    if _page_validators is None:
+        _page_validators = get_page_validators()
+    
+    validators = _page_validators.get(url)
+    
+    if validators and validators["date"] == date:
+        return validators
+    return None
+
+def _host_semaphore(url):
+    """Семафор для хоста сторінки"""
+    host = urlsplit(url).netloc
+    
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST)
+    
+    return _host_limits[host]
+
+async def fetch_page(url, date):
+    """Завантажує одну сторінку, повертає (HTML bytes або None, якщо вона не змінилась, нові валідатори або None)"""
+    
+    async with _host_semaphore(url):
+        try:
+            return await _fetch_page(url, date)
+        except Exception:
+            FETCH_ERRORS.inc(url)
+            raise
+
+async def _fetch_page(url, date):
+    validators = _get_validators(url, date)
+    headers = {}
+    
+    if validators:
+        if validators["etag"]:
+            headers["If-None-Match"] = validators["etag"]
+        if validators["last_modified"]:
+            headers["If-Modified-Since"] = validators["last_modified"]
+    
+    with FETCH_SECONDS.time(url):
+        response = await get_http_client().get(url, headers=headers)
+    
+    if response.status_code == 304:
+        return None, None
+    
+    if response.status_code != 200:
+        raise Exception(f"Помилка завантаження {url}: статус {response.status_code}")
+    
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    
+    new_validators = {
+        "date": date,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_hash": content_hash
+    }
+    
+    if validators and validators["content_hash"] == content_hash:
+        return None, new_validators
+    
+    return response.content, new_validators
+
+def commit_page_validators(city):
+    """Зберігає валідатори сторінок міста після того, як його графіки записано в БД"""
+    global _page_validators
+    
+    if _page_validators is None:
+        _page_validators = get_page_validators()
+    
+    for url, validators in _pending_validators.pop(city, {}).items():
+        save_page_validators(url, **validators)
+        _page_validators[url] = validators
+
+def discard_page_validators(city):
+    """Забуває валідатори міста, чиї графіки не збережено (наступна перевірка розбере сторінки знову)"""
+    _pending_validators.pop(city, None)
+
+def _parse_timed(source, html):
+    """source.parse із вимірюванням часу (виконується в потоці виконавця)"""
+    with PARSE_SECONDS.time(source.city):
+        return (source.parse or parse_schedule)(html)
+
+def parse_schedule(html, encoding="utf-8"):
+    """Розбирає сторінку графіка (bytes), повертає {черга: [проміжки]}"""
+    
+    if not html or not html.strip():
+        return {}
+    
+    root = lxml.html.document_fromstring(html, parser=lxml.html.HTMLParser(encoding=encoding))
+    queues = {}
+    # Черги, що чекають на свій список (найближчий <ul> після заголовка)
+    waiting = []
+    
+    # Обходимо лише заголовки черг і списки проміжків
+    for element in root.iter("strong", "ul"):
+        if element.tag == "strong":
+            match = QUEUE_PATTERN.search(element.text_content())
+            
+            if match:
+                queue_name = match.group(1)  # "1.1", "2.1", "2.2", тощо
+                queues[queue_name] = []
+                waiting.append(queue_name)
+            continue
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        if not waiting:
+            continue
         
-        today_date = datetime.now().strftime("%Y-%m-%d")
-        schedules = {today_date: {}}
+        time_slots = []
         
-        response = requests.get(ZHMERYNKA_URL, headers=headers, timeout=15)
+        for item in element.iter("li"):
+            item_text = item.text_content()
+            
+            # Пропускаємо час зі світлом (💡)
+            if '💡' in item_text:
+                continue
+            
+            time_match = TIME_RANGE_PATTERN.search(item_text)
+            
+            if time_match:
+                time_slots.append(f"{time_match.group(1)}-{time_match.group(2)}")
         
-        if response.status_code != 200:
-            raise Exception(f"Помилка завантаження: статус {response.status_code}")
+        for queue_name in waiting:
+            queues[queue_name] = time_slots
+        waiting = []
+    
+    return queues
+
+async def fetch_outage_schedule(source):
+    """Отримує графік відключень для всіх підчерг одного міста
+    
+    Повертає лише дати, сторінки яких змінились з останньої перевірки,
+    або None у разі помилки.
+    """
+    
+    # Валідатори попередньої незавершеної перевірки не стосуються цих даних
+    discard_page_validators(source.city)
+    
+    try:
+        print(f"🔍 Завантажую дані з {source.url}...")
         
-        soup = BeautifulSoup(response.text, "html.parser")
+        now = datetime.now(TIMEZONE)
+        today_date = now.strftime("%Y-%m-%d")
+        tomorrow_date = (now + timedelta(days=1)).strftime("%Y-%m-%d")
         
-        # Знаходимо всі блоки з чергами
-        queue_blocks = soup.find_all('strong')
+        # Обидві сторінки завантажуються одночасно, розбір - у потоці виконавця,
+        # щоб не блокувати обробку повідомлень
+        today_result, tomorrow_result = await asyncio.gather(
+            fetch_page(source.url, today_date),
+            fetch_page(source.tomorrow_url, tomorrow_date),
+            return_exceptions=True
+        )
         
-        for block in queue_blocks:
-            text = block.get_text()
-            match = re.search(r'Черга\s+([\d\.]+)', text)
-            
-            if match:
-                queue_name = match.group(1)  # "1.1", "2.1", "2.2", тощо
-                
-                time_slots = []
-                next_ul = block.find_next('ul')
-                
-                if next_ul:
-                    items = next_ul.find_all('li')
-                    
-                    for item in items:
-                        item_text = item.get_text(strip=True)
-                        
-                        # Пропускаємо час зі світлом (💡)
-                        if '💡' in item_text:
-                            continue
-                        
-                        # Витягуємо час
-                        time_match = re.search(r'(\d{2}:\d{2})\s*[–-]\s*(\d{2}:\d{2})', item_text)
-                        
-                        if time_match:
-                            start_time = time_match.group(1)
-                            end_time = time_match.group(2)
-                            time_slots.append(f"{start_time}-{end_time}")
-                
-                schedules[today_date][queue_name] = time_slots
-                print(f"✅ Черга {queue_name}: {time_slots}")
+        if isinstance(today_result, BaseException):
+            raise today_result
         
-        # Завантажуємо графік на завтра
-        tomorrow_date = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
-        tomorrow_url = f"{ZHMERYNKA_URL}/grafik-na-zavtra"
+        schedules = {}
+        validators = {}
         
-        try:
-            response_tomorrow = requests.get(tomorrow_url, headers=headers, timeout=15)
+        today_html, validators[source.url] = today_result
+        
+        if today_html is None:
+            print(f"✅ {source.city}: сторінка на сьогодні не змінилась")
+        else:
+            schedules[today_date] = await asyncio.to_thread(_parse_timed, source, today_html)
             
-            if response_tomorrow.status_code == 200:
-                soup_tomorrow = BeautifulSoup(response_tomorrow.text, "html.parser")
-                schedules[tomorrow_date] = {}
-                
-                queue_blocks = soup_tomorrow.find_all('strong')
-                
-                for block in queue_blocks:
-                    text = block.get_text()
-                    match = re.search(r'Черга\s+([\d\.]+)', text)
-                    
-                    if match:
-                        queue_name = match.group(1)
-                        
-                        time_slots = []
-                        next_ul = block.find_next('ul')
-                        
-                        if next_ul:
-                            items = next_ul.find_all('li')
-                            
-                            for item in items:
-                                item_text = item.get_text(strip=True)
-                                
-                                if '💡' in item_text:
-                                    continue
-                                
-                                time_match = re.search(r'(\d{2}:\d{2})\s*[–-]\s*(\d{2}:\d{2})', item_text)
-                                
-                                if time_match:
-                                    start_time = time_match.group(1)
-                                    end_time = time_match.group(2)
-                                    time_slots.append(f"{start_time}-{end_time}")
-                        
-                        schedules[tomorrow_date][queue_name] = time_slots
-                
-                print(f"✅ Завантажено графік на завтра")
-        except Exception as e:
-            print(f"⚠️ Не вдалося завантажити графік на завтра: {e}")
+            for queue_name, time_slots in schedules[today_date].items():
+                print(f"✅ {source.city}, черга {queue_name}: {time_slots}")
         
-        print(f"✅ Графіки завантажено для {len(schedules)} дат")
+        # Графік на завтра
+        if isinstance(tomorrow_result, BaseException):
+            print(f"⚠️ {source.city}: не вдалося завантажити графік на завтра: {tomorrow_result}")
+        else:
+            tomorrow_html, validators[source.tomorrow_url] = tomorrow_result
+            
+            if tomorrow_html is None:
+                print(f"✅ {source.city}: сторінка на завтра не змінилась")
+            else:
+                schedules[tomorrow_date] = await asyncio.to_thread(_parse_timed, source, tomorrow_html)
+                print(f"✅ {source.city}: завантажено графік на завтра")
+        
+        # Валідатори - лише для сторінок, графіки яких повернуто разом з ними
+        _pending_validators[source.city] = {url: v for url, v in validators.items() if v}
+        
+        print(f"✅ {source.city}: графіки завантажено для {len(schedules)} дат")
         return schedules
         
     except Exception as e:
-        print(f"❌ Помилка парсингу: {e}")
+        print(f"❌ {source.city}: помилка парсингу: {e}")
         import traceback
         traceback.print_exc()
-        return {}
+        return None
 
-def format_schedule(time_ranges):
-    """Форматує список часових проміжків"""
-    if not time_ranges:
-        return "✅ Відключень немає"
-    
-    if isinstance(time_ranges, list) and len(time_ranges) == 0:
-        return "✅ Відключень немає"
-    
-    return "\n".join([f"⚡️ {time_range}" for time_range in time_ranges])
+async def fetch_all_schedules(sources):
+    """Завантажує графіки всіх міст одночасно, повертає {місто: графіки або None}"""
+    sources = list(sources)
+    results = await asyncio.gather(*[fetch_outage_schedule(source) for source in sources])
+    return {source.city: result for source, result in zip(sources, results)}
 
 if __name__ == "__main__":
+    import sys
+    
     print("=== ТЕСТ ПАРСЕРА ===\n")
-    data = fetch_outage_schedule()
+    
+    if len(sys.argv) > 1:
+        # Офлайн-перевірка на збережених сторінках: python parser.py page.html ...
+        data = {}
+        for path in sys.argv[1:]:
+            with open(path, "rb") as f:
+                data[path] = parse_schedule(f.read())
+    else:
+        from sources import get_source
+        data = asyncio.run(fetch_outage_schedule(get_source(None)))
     
     if data:
         for date, queues in data.items():
@@ -0,0 +1,133 @@
+# reminders.py - Нагадування за N хвилин до відключення та увімкнення світла
+
+import asyncio
+import heapq
+import itertools
+from datetime import datetime
+
+from broadcast import broadcast
+from config import TIMEZONE, REMINDER_MINUTES_BEFORE
+from database import iter_subscribers
+from timeline import transitions, to_minute, from_minute
+
+# Купа подій: (хвилина надсилання, порядковий номер, (місто, черга), хвилина переходу, відключення?, покоління)
+_events = []
+_counter = itertools.count()
+# (місто, черга) -> покоління; після перебудови старі події черги пропускаються
+_generations = {}
+# Уже надіслані нагадування ((місто, черга), хвилина переходу, відключення?)
+_sent = set()
+
+_wakeup = None
+_task = None
+# Розсилки нагадувань, що ще тривають
+_sending = set()
+
+def reschedule_queues(keys):
+    """Перебудовує події лише для вказаних (місто, черга)"""
+    now_minute = to_minute(datetime.now(TIMEZONE))
+    
+    for key in keys:
+        generation = _generations.get(key, 0) + 1
+        _generations[key] = generation
+        
+        for minute, outage_starts in transitions(*key, now_minute):
+            if (key, minute, outage_starts) in _sent:
+                continue
+            
+            fire_at = max(minute - REMINDER_MINUTES_BEFORE, now_minute)
+            heapq.heappush(_events, (fire_at, next(_counter), key, minute, outage_starts, generation))
+    
+    if _wakeup is not None:
+        _wakeup.set()
+
+def on_schedules_changed(items):
+    """Слухач кешу графіків: перебудовує події для черг, що змінились"""
+    reschedule_queues({(city, queue) for city, _, queue, _ in items})
+
+def _render(queue, minute, outage_starts):
+    """Текст нагадування"""
+    at = from_minute(minute).strftime("%H:%M")
+    
+    if outage_starts:
+        return f"""
+⏰ <b>Скоро відключення світла</b>
+
+🔢 Черга: {queue}
+🔴 Відключення о {at}
+"""
+    
+    return f"""
+⏰ <b>Скоро увімкнуть світло</b>
+
+🔢 Черга: {queue}
+💡 Увімкнення о {at}
+"""
+
+async def _send(key, text):
+    """Розсилає нагадування підписникам черги порціями, не блокуючи цикл подій"""
+    city, queue = key
+    
+    try:
+        # Кожна порція підписників одразу йде в розсилку; між порціями
+        # цикл подій обробляє інші запити
+        for chunk in iter_subscribers([key]):
+            broadcast([chat_id for chat_id, _ in chunk], text, label=f"нагадування, {city}, черга {queue}")
+            await asyncio.sleep(0)
+    except Exception as e:
+        print(f"❌ Не вдалося розіслати нагадування ({city}, черга {queue}): {e}")
+
+def _fire_due(now_minute):
+    """Запускає розсилку всіх нагадувань, час яких настав"""
+    while _events and _events[0][0] <= now_minute:
+        _, _, key, minute, outage_starts, generation = heapq.heappop(_events)
+        
+        if generation != _generations.get(key) or minute <= now_minute:
+            continue
+        
+        sent_key = (key, minute, outage_starts)
+        if sent_key in _sent:
+            continue
+        _sent.add(sent_key)
+        
+        city, queue = key
+        print(f"⏰ Нагадування: {city}, черга {queue}")
+        
+        task = asyncio.get_running_loop().create_task(_send(key, _render(queue, minute, outage_starts)))
+        _sending.add(task)
+        task.add_done_callback(_sending.discard)
+    
+    # Забуваємо надіслані нагадування про минулі переходи
+    for key in [key for key in _sent if key[1] <= now_minute]:
+        _sent.discard(key)
+
+async def _run():
+    while True:
+        _wakeup.clear()
+        now = datetime.now(TIMEZONE)
+        _fire_due(to_minute(now))
+        
+        if _events:
+            fire_at = from_minute(_events[0][0]).replace(tzinfo=TIMEZONE)
+            delay = max(1.0, (fire_at - now).total_seconds())
+        else:
+            delay = None
+        
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+def start_reminders():
+    """Запуск нагадувань (викликати з циклу подій бота)"""
+    global _wakeup, _task
+    _wakeup = asyncio.Event()
+    _task = asyncio.get_running_loop().create_task(_run())
+    print(f"✅ Нагадування за {REMINDER_MINUTES_BEFORE} хв запущено")
+
+async def stop_reminders():
+    """Зупинка нагадувань"""
+    tasks = [task for task in (_task, *_sending) if task is not None]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,117 +1,248 @@
 # scheduler.py - Автоматична перевірка оновлень
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
-from parser import fetch_outage_schedule
-from database import save_schedule, get_schedule, get_all_users_by_queue
-from config import CHECK_INTERVAL_MINUTES
+from datetime import datetime, time, timedelta
+import asyncio
+import random
+from sources import SOURCES
+from database import save_schedules_bulk, compact_history
+from cache import evict_schedules_before
+from timeline import evict_before as evict_timeline_before
+from messages import prerender, evict_messages_before
+from notifications import schedule_flush
+from metrics import CHECK_SECONDS
+from config import (
+    CHECK_INTERVAL_MINUTES,
+    CHECK_PROFILES,
+    CHECK_BACKOFF_FACTOR,
+    CHECK_FAILURE_FACTOR,
+    CHECK_JITTER,
+    TIMEZONE,
+    MANUAL_REFRESH_FRESHNESS_SECONDS,
+    HISTORY_RETENTION_DAYS
+)
 
-scheduler = BackgroundScheduler(timezone="Europe/Kyiv")
 bot_application = None
+# Поточна перевірка: таймер і всі натискання "Оновити" чекають на одну й ту саму
+check_task = None
+# Час останньої успішної перевірки
+last_check_at = None
+
+# Поточний інтервал перевірки, хв
+check_interval = CHECK_INTERVAL_MINUTES
+# Помилки перевірки поспіль
+check_failures = 0
 
 def set_bot_application(app):
     """Встановлює посилання на бота"""
     global bot_application
     bot_application = app
 
-async def send_notification(chat_id, message):
-    """Відправляє сповіщення"""
-    try:
-        if bot_application:
-            await bot_application.bot.send_message(
-                chat_id=chat_id,
-                text=message,
-                parse_mode="HTML"
-            )
-            print(f"✅ Надіслано сповіщення {chat_id}")
-    except Exception as e:
-        print(f"❌ Помилка відправки {chat_id}: {e}")
+async def check_updates():
+    """Перевірка оновлень (одночасно виконується лише одна, решта чекають на неї)"""
+    global check_task
+    
+    if check_task is None or check_task.done():
+        check_task = asyncio.ensure_future(_run_check())
+    
+    # shield: скасування одного з тих, хто чекає, не зупиняє перевірку для інших
+    return await asyncio.shield(check_task)
+
+async def _run_check():
+    global last_check_at
+    
+    with CHECK_SECONDS.time():
+        changed = await _check_updates()
+    
+    success = changed is not None
+    if success:
+        last_check_at = datetime.now(TIMEZONE)
+    
+    _adapt_interval(success, changed)
+    return success
+
+def _profile(now):
+    """(мінімум, максимум, кінець профілю) для моменту now"""
+    profiles = sorted(CHECK_PROFILES)
+    # До першого профілю доби діє останній (з попереднього дня)
+    current = profiles[-1]
+    end_hour = profiles[0][0]
+    
+    for index, profile in enumerate(profiles):
+        if profile[0] <= now.hour:
+            current = profile
+            end_hour = profiles[index + 1][0] if index + 1 < len(profiles) else profiles[0][0] + 24
+    
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return current[1], current[2], midnight + timedelta(hours=end_hour)
+
+def _adapt_interval(success, changed):
+    """Оновлює інтервал після перевірки: зміни - частіше, тиша - рідше"""
+    global check_interval, check_failures
+    
+    low, high, _ = _profile(datetime.now(TIMEZONE))
+    
+    if not success:
+        check_failures += 1
+        return
+    
+    check_failures = 0
+    if changed:
+        check_interval = low
+    else:
+        check_interval = check_interval * CHECK_BACKOFF_FACTOR
+    
+    check_interval = min(high, max(low, check_interval))
+
+def next_check_delay():
+    """Через скільки секунд наступна перевірка (з урахуванням помилок, профілю і розкиду)"""
+    now = datetime.now(TIMEZONE)
+    low, high, profile_end = _profile(now)
+    
+    if check_failures:
+        # Після помилок - експоненційна затримка від мінімуму профілю
+        minutes = min(high, low * CHECK_FAILURE_FACTOR ** check_failures)
+    else:
+        minutes = min(high, max(low, check_interval))
+    
+    delay = minutes * 60 * random.uniform(1 - CHECK_JITTER, 1 + CHECK_JITTER)
+    
+    # Не проскакуємо початок наступного профілю (напр. ранок після нічного інтервалу)
+    return min(delay, (profile_end - now).total_seconds() + random.uniform(0, 60))
 
-def check_updates():
-    """Перевірка оновлень"""
+def get_fresh_check_time():
+    """Час останньої перевірки, якщо вона була в межах вікна свіжості, інакше None"""
+    if last_check_at is None:
+        return None
+    
+    age = (datetime.now(TIMEZONE) - last_check_at).total_seconds()
+    if age < MANUAL_REFRESH_FRESHNESS_SECONDS:
+        return last_check_at
+    return None
+
+async def _check_updates():
+    """Одна перевірка: завантаження, порівняння з БД і сповіщення
+    
+    Повертає True/False - чи знайдено зміни, або None у разі помилки.
+    """
     try:
         print(f"\n🔄 Перевірка: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
-        new_data = fetch_outage_schedule()
+        # httpx і lxml не потрібні для відповідей користувачам - імпорт лише тут,
+        # щоб не затримувати запуск бота
+        from parser import fetch_all_schedules, commit_page_validators, discard_page_validators
+        
+        # Усі міста завантажуються одночасно (з обмеженням на кожен сайт)
+        results = await fetch_all_schedules(SOURCES.values())
+        failed = [city for city, new_data in results.items() if new_data is None]
+        
+        if failed:
+            print(f"⚠️ Не вдалося отримати дані: {', '.join(failed)}")
         
-        if not new_data:
-            print("⚠️ Не вдалося отримати дані")
-            return
+        if len(failed) == len(results):
+            return None
         
+        today = datetime.now(TIMEZONE).strftime("%Y-%m-%d")
         changes_found = False
         
-        for date, queues_data in new_data.items():
-            for queue, time_ranges in queues_data.items():
-                
-                old_schedule = get_schedule(date, queue)
-                
-                if old_schedule != time_ranges:
-                    changes_found = True
-                    print(f"📢 Зміна: {date}, Черга {queue}")
-                    print(f"   Старий: {old_schedule}")
-                    print(f"   Новий: {time_ranges}")
-                    
-                    save_schedule(date, queue, time_ranges)
-                    
-                    if bot_application and old_schedule is not None:
-                        message = f"""
-🔔 <b>ЗМІНА ГРАФІКУ!</b>
-
-📅 Дата: {date}
-🔢 Черга: {queue}
-
-<b>Новий графік:</b>
-{format_time_ranges(time_ranges)}
-"""
-                        users = get_all_users_by_queue(queue)
-                        print(f"   Сповіщення {len(users)} користувачам...")
-                        
-                        import asyncio
-                        for user_id in users:
-                            asyncio.create_task(send_notification(user_id, message))
-                else:
-                    save_schedule(date, queue, time_ranges)
+        for city, new_data in results.items():
+            if new_data is None:
+                continue
+            
+            try:
+                changes = save_schedules_bulk(new_data, city)
+            except Exception as e:
+                # Сторінки міста розберуться знову під час наступної перевірки
+                discard_page_validators(city)
+                print(f"❌ {city}: не вдалося зберегти графіки: {e}")
+                continue
+            
+            # Валідатори фіксуються лише після того, як їхні графіки записано
+            commit_page_validators(city)
+            changes_found = changes_found or bool(changes)
+            
+            # Готуємо тексти для всіх графіків одразу, обробники лише відправляють їх
+            for date, queues_data in new_data.items():
+                kind = "today" if date == today else "tomorrow"
+                for queue in queues_data:
+                    prerender(city, date, queue, [kind])
+            
+            for date, queue, old_ranges in changes:
+                time_ranges = new_data[date][queue]
+                print(f"📢 Зміна: {city}, {date}, Черга {queue}")
+                print(f"   Новий: {time_ranges}")
+            
+            # Зміни вже записані в outbox; сповіщення збираються у вікні NOTIFY_DEBOUNCE_SECONDS
+            if changes and bot_application:
+                schedule_flush()
+        
         
         if not changes_found:
             print("✅ Змін немає")
         else:
             print("✅ Оновлення завершено")
+        
+        return changes_found
             
     except Exception as e:
         print(f"❌ Помилка: {e}")
         import traceback
         traceback.print_exc()
+        return None
 
-def format_time_ranges(time_ranges):
-    """Форматує часові проміжки"""
-    if not time_ranges:
-        return "✅ Відключень немає"
-    
-    if isinstance(time_ranges, list) and len(time_ranges) == 0:
-        return "✅ Відключень немає"
+async def check_updates_job(context):
+    """Перевірка за розкладом; наступна планується з адаптивним інтервалом"""
+    try:
+        await check_updates()
+    finally:
+        _schedule_next_check()
+
+def _schedule_next_check():
+    # Планувальник уже зупинено (бот завершує роботу)
+    if not bot_application.job_queue.scheduler.running:
+        return
     
-    return "\n".join([f"⚡️ {tr}" for tr in time_ranges])
+    delay = next_check_delay()
+    bot_application.job_queue.run_once(check_updates_job, when=delay, name="check_outages")
+    print(f"⏰ Наступна перевірка через {delay / 60:.1f} хв")
 
-def start_scheduler():
-    """Запуск планувальника"""
-    print(f"⏰ Планувальник (кожні {CHECK_INTERVAL_MINUTES} хв)")
+async def evict_cache_job(context):
+    """Опівночі (за Києвом) прибирає з кешу графіки за минулі дні"""
+    today = datetime.now(TIMEZONE).strftime("%Y-%m-%d")
+    removed = evict_schedules_before(today)
+    evict_messages_before(today)
+    evict_timeline_before(today)
+    print(f"🧹 Кеш: видалено {removed} графіків до {today}")
+
+async def compact_history_job(context):
+    """Щоночі стискає історію змін (у потоці виконавця)"""
+    await asyncio.to_thread(compact_history, HISTORY_RETENTION_DAYS)
+
+def start_scheduler(first_check_delay=0):
+    """Запуск планувальника в циклі подій бота"""
+    print(f"⏰ Планувальник (адаптивний інтервал, спочатку {CHECK_INTERVAL_MINUTES} хв)")
+    
+    bot_application.job_queue.run_once(check_updates_job, when=first_check_delay, name="check_outages")
+    
+    bot_application.job_queue.run_daily(
+        evict_cache_job,
+        time=time(0, 0, tzinfo=TIMEZONE),
+        name="evict_cache"
+    )
     
-    scheduler.add_job(
-        check_updates,
-        "interval",
-        minutes=CHECK_INTERVAL_MINUTES,
-        id="check_outages",
-        replace_existing=True,
-        next_run_time=datetime.now()
+    bot_application.job_queue.run_daily(
+        compact_history_job,
+        time=time(3, 30, tzinfo=TIMEZONE),
+        name="compact_history"
     )
     
-    scheduler.start()
     print("✅ Планувальник запущено")
 
 def stop_scheduler():
     """Зупинка планувальника"""
     try:
-        scheduler.shutdown()
+        for name in ("check_outages", "evict_cache", "compact_history"):
+            for job in bot_application.job_queue.get_jobs_by_name(name):
+                job.schedule_removal()
         print("⏹️ Планувальник зупинено")
     except:
         pass
@@ -0,0 +1,79 @@
+# slots.py - Компактне подання графіка: бітова маска з 96 чвертьгодинних слотів
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+MASK_BYTES = SLOTS_PER_DAY // 8
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+# Біт i встановлено, якщо в слоті [i*15, (i+1)*15) хв світла немає
+
+def _to_minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def _to_hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def ranges_to_mask(time_ranges):
+    """["08:00-10:00", ...] -> маска; None, якщо проміжки не кратні 15 хв або некоректні"""
+    mask = 0
+    
+    for time_range in time_ranges:
+        try:
+            start_text, end_text = time_range.split("-")
+            start = _to_minutes(start_text)
+            end = _to_minutes(end_text)
+        except ValueError:
+            return None
+        
+        # "22:00-00:00" і "20:00-23:59" (так пише сайт) означають до кінця доби;
+        # точний текст зберігається в JSON графіка
+        if (end == 0 and start > 0) or end == 24 * 60 - 1:
+            end = 24 * 60
+        
+        if start % SLOT_MINUTES or end % SLOT_MINUTES or not 0 <= start < end <= 24 * 60:
+            return None
+        
+        first = start // SLOT_MINUTES
+        last = end // SLOT_MINUTES
+        mask |= ((1 << (last - first)) - 1) << first
+    
+    return mask
+
+def mask_to_ranges(mask):
+    """Маска -> відсортований список проміжків без накладань"""
+    time_ranges = []
+    slot = 0
+    
+    while mask >> slot:
+        if not (mask >> slot) & 1:
+            # Пропускаємо весь блок нулів одразу
+            slot += ((mask >> slot) & -(mask >> slot)).bit_length() - 1
+            continue
+        
+        start = slot
+        run = ~(mask >> slot)
+        slot += (run & -run).bit_length() - 1
+        time_ranges.append(f"{_to_hhmm(start * SLOT_MINUTES)}-{_to_hhmm(slot * SLOT_MINUTES)}")
+    
+    return time_ranges
+
+def mask_to_blob(mask):
+    """Маска -> 12 байт для SQLite"""
+    return mask.to_bytes(MASK_BYTES, "big")
+
+def blob_to_mask(blob):
+    """12 байт із SQLite -> маска"""
+    return int.from_bytes(blob, "big")
+
+def outage_minutes(mask):
+    """Загальна тривалість відключень, хв"""
+    return mask.bit_count() * SLOT_MINUTES
+
+def is_power_off(mask, minute_of_day):
+    """Чи немає світла о вказаній хвилині доби"""
+    return bool((mask >> (minute_of_day // SLOT_MINUTES)) & 1)
+
+def diff_masks(old, new):
+    """Повертає (додані відключення, скасовані відключення)"""
+    return new & ~old, old & ~new
@@ -0,0 +1,33 @@
+# sources.py - Реєстр міст: сторінки з графіками, черги і парсер
+
+from urllib.parse import urlsplit
+
+from config import CITY, VOE_URL, QUEUES
+
+class Source:
+    """Джерело графіків одного міста"""
+    
+    def __init__(self, city, url, queues, tomorrow_url=None, parse=None):
+        self.city = city
+        self.url = url
+        self.tomorrow_url = tomorrow_url or f"{url}/grafik-na-zavtra"
+        self.queues = queues
+        # parse(html_bytes) -> {черга: [проміжки]}; None - parser.parse_schedule
+        # (parser.py з httpx і lxml завантажується лише під час першої перевірки)
+        self.parse = parse
+    
+    @property
+    def host(self):
+        return urlsplit(self.url).netloc
+
+# Нове місто - ще один Source у цьому списку
+SOURCES = {
+    source.city: source
+    for source in [
+        Source(CITY, VOE_URL, QUEUES),
+    ]
+}
+
+def get_source(city):
+    """Джерело для міста (місто за замовчуванням, якщо такого немає)"""
+    return SOURCES.get(city) or SOURCES[CITY]
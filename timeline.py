@@ -0,0 +1,133 @@
+# timeline.py - Індекс переходів "є світло / немає світла" для кожної черги
+
+from bisect import bisect_right
+from datetime import date as date_cls, datetime, timedelta
+
+from slots import SLOT_MINUTES, ranges_to_mask
+
+MINUTES_PER_DAY = 24 * 60
+
+# (місто, черга) -> {дата: маска або None}
+_masks = {}
+# (місто, черга) -> (межі відключень, покриті даними проміжки)
+# Межі: [початок1, кінець1, початок2, кінець2, ...] у хвилинах від 0001-01-01
+_index = {}
+
+def _day_start(date):
+    return date_cls.fromisoformat(date).toordinal() * MINUTES_PER_DAY
+
+def to_minute(moment):
+    """datetime -> хвилина на шкалі індексу (за місцевим часом)"""
+    return moment.date().toordinal() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+def from_minute(minute):
+    """Хвилина на шкалі індексу -> datetime без часового поясу"""
+    day, minute_of_day = divmod(minute, MINUTES_PER_DAY)
+    return datetime.combine(date_cls.fromordinal(day), datetime.min.time()) + timedelta(minutes=minute_of_day)
+
+def update_schedules(items):
+    """Оновлює індекс для змінених [(місто, дата, черга, графік)]"""
+    touched = set()
+    
+    for city, date, queue, time_ranges in items:
+        mask = ranges_to_mask(time_ranges) if time_ranges is not None else None
+        _masks.setdefault((city, queue), {})[date] = mask
+        touched.add((city, queue))
+    
+    # Перебудовуємо лише черги, графік яких змінився
+    for key in touched:
+        _rebuild(key)
+    
+    return touched
+
+def _rebuild(key):
+    bounds = []
+    covered = []
+    
+    for date, mask in sorted(_masks.get(key, {}).items()):
+        if mask is None:
+            continue
+        
+        base = _day_start(date)
+        
+        if covered and covered[-1][1] == base:
+            covered[-1] = (covered[-1][0], base + MINUTES_PER_DAY)
+        else:
+            covered.append((base, base + MINUTES_PER_DAY))
+        
+        slot = 0
+        while mask >> slot:
+            rest = mask >> slot
+            
+            if not rest & 1:
+                slot += (rest & -rest).bit_length() - 1
+                continue
+            
+            run = ~rest
+            end_slot = slot + (run & -run).bit_length() - 1
+            start = base + slot * SLOT_MINUTES
+            end = base + end_slot * SLOT_MINUTES
+            
+            # Відключення, що триває через північ, - один проміжок
+            if bounds and bounds[-1] == start:
+                bounds[-1] = end
+            else:
+                bounds.extend((start, end))
+            
+            slot = end_slot
+    
+    _index[key] = (bounds, covered)
+
+def evict_before(date):
+    """Видаляє з індексу дати, раніші за вказану"""
+    for key, masks in _masks.items():
+        old = [day for day in masks if day < date]
+        for day in old:
+            del masks[day]
+        if old:
+            _rebuild(key)
+
+def power_status(city, queue, minute):
+    """Стан черги на момент minute
+
+    Повертає None, якщо даних немає, інакше (світла немає?, хвилина наступної
+    зміни або None, якщо вона за межами відомих графіків).
+    """
+    entry = _index.get((city, queue))
+    if entry is None:
+        return None
+    
+    bounds, covered = entry
+    segment = next((seg for seg in covered if seg[0] <= minute < seg[1]), None)
+    if segment is None:
+        return None
+    
+    position = bisect_right(bounds, minute)
+    is_off = position % 2 == 1
+    
+    next_change = bounds[position] if position < len(bounds) else None
+    if next_change is None or next_change >= segment[1]:
+        # Світло є до кінця відомих даних, або відключення триває за їхні межі
+        next_change = None
+    
+    return is_off, next_change
+
+def transitions(city, queue, after_minute):
+    """Відомі переходи після after_minute: [(хвилина, True - початок відключення)]
+    
+    Межі на краях відомих даних не вважаються переходами: що було до і після, невідомо.
+    """
+    entry = _index.get((city, queue))
+    if entry is None:
+        return []
+    
+    bounds, covered = entry
+    edges = {edge for segment in covered for edge in segment}
+    result = []
+    
+    for position in range(bisect_right(bounds, after_minute), len(bounds)):
+        minute = bounds[position]
+        if minute not in edges:
+            result.append((minute, position % 2 == 0))
+    
+    return result
@@ -0,0 +1,66 @@
+# updates.py - Паралельна обробка оновлень зі збереженням порядку в межах чату
+
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from metrics import UPDATE_WAIT_SECONDS
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Різні чати обробляються одночасно (до workers), оновлення одного чату - по черзі
+    
+    Так стан ConversationHandler (вибір черги, міста) лишається коректним, а повільний
+    обробник (напр. force_update) затримує лише свій чат.
+    """
+    
+    def __init__(self, workers, max_pending):
+        # Семафор базового класу обмежує кількість оновлень у роботі разом з тими, що чекають
+        super().__init__(max_pending)
+        self.workers = asyncio.BoundedSemaphore(workers)
+        # chat_id -> [замок, скільки оновлень чату в роботі або чекають]
+        self.chats = {}
+    
+    async def do_process_update(self, update, coroutine):
+        received_at = time.perf_counter()
+        key = self._chat_key(update)
+        
+        if key is None:
+            async with self.workers:
+                UPDATE_WAIT_SECONDS.observe(time.perf_counter() - received_at)
+                await coroutine
+            return
+        
+        entry = self.chats.get(key)
+        if entry is None:
+            entry = self.chats[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        
+        try:
+            # Спершу черга чату, потім вільний воркер: оновлення, що чекають на свій чат,
+            # не займають воркерів
+            async with entry[0]:
+                async with self.workers:
+                    UPDATE_WAIT_SECONDS.observe(time.perf_counter() - received_at)
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.chats[key]
+    
+    @staticmethod
+    def _chat_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
@@ -0,0 +1,118 @@
+# webhook.py - Отримання оновлень через вебхук (вбудований HTTP-сервер замість run_polling)
+
+import asyncio
+import hmac
+import json
+import secrets
+import signal
+
+from telegram import Update
+
+from config import (
+    ALLOWED_UPDATES,
+    WEBHOOK_URL,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET
+)
+from http_server import HttpServer
+
+def _make_handler(app, secret):
+    """Обробник HTTP-запитів: оновлення від Telegram -> app.update_queue"""
+    
+    async def handle(request):
+        if request.method == "GET" and request.path == "/":
+            return 200, b"ok\n", "text/plain"
+        
+        if request.path != WEBHOOK_PATH:
+            return 404, b"not found\n", "text/plain"
+        
+        if request.method != "POST":
+            return 405, b"method not allowed\n", "text/plain"
+        
+        token = request.headers.get("x-telegram-bot-api-secret-token", "")
+        if secret and not hmac.compare_digest(token.encode(), secret.encode()):
+            return 403, b"forbidden\n", "text/plain"
+        
+        # Коректний JSON, що не є оновленням ([1, 2], 42, {"message": 5}, {}),
+        # теж 400: інакше 500, і Telegram повторював би його без кінця
+        try:
+            data = json.loads(request.body)
+            update = Update.de_json(data, app.bot) if isinstance(data, dict) else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            update = None
+        
+        if update is None:
+            return 400, b"bad update\n", "text/plain"
+        
+        # Відповідаємо одразу: обробка йде у воркерах Application
+        await app.update_queue.put(update)
+        return 200, b"", "text/plain"
+    
+    return handle
+
+async def run_webhook(app):
+    """Запуск бота в режимі вебхука (до SIGINT/SIGTERM)"""
+    # Без WEBHOOK_URL (локальна перевірка) секрет перевіряється, лише якщо заданий явно
+    secret = WEBHOOK_SECRET or (secrets.token_urlsafe(32) if WEBHOOK_URL else "")
+    
+    # Без секрету будь-хто міг би надсилати підроблені оновлення - тоді сервер
+    # доступний лише локально, хоч би який WEBHOOK_HOST було задано
+    host = WEBHOOK_HOST if secret else "127.0.0.1"
+    if host != WEBHOOK_HOST:
+        print(f"⚠️ Секрет вебхука не задано: сервер слухає лише {host} замість {WEBHOOK_HOST}")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    
+    # Той самий порядок запуску і зупинки, що й у Application.run_polling
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    
+    server = HttpServer(_make_handler(app, secret))
+    await server.start(host, WEBHOOK_PORT)
+    print(f"🌐 Вебхук: http://{host}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    
+    try:
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                allowed_updates=ALLOWED_UPDATES,
+                secret_token=secret
+            )
+            print(f"✅ Вебхук зареєстровано: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            print("⚠️ WEBHOOK_URL не задано: setWebhook не викликається (локальна перевірка)")
+        
+        await stop.wait()
+    finally:
+        print("\n⏹️ Зупинка бота...")
+        await server.stop()
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+if __name__ == "__main__":
+    # Локальна перевірка: python webhook.py update.json [update2.json ...]
+    # надсилає збережені оновлення на запущений у режимі вебхука бот
+    import sys
+    import httpx
+    
+    url = f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+    
+    for path in sys.argv[1:]:
+        with open(path, "rb") as f:
+            response = httpx.post(url, content=f.read(), headers=headers)
+        print(f"{path}: {response.status_code}")